@@ -1,12 +1,28 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session, send_from_directory
+from flask import Flask, Response, render_template, request, jsonify, redirect, url_for, flash, session, send_from_directory, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from apscheduler.schedulers.background import BackgroundScheduler
+from sqlalchemy import case, create_engine, delete, event, insert, inspect, literal, select, text, true, tuple_, union_all, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased, make_transient_to_detached, object_session
+from collections import OrderedDict, defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-import random
-import string
+import base64
+import hashlib
+import hmac
+import json
+import numpy as np
+import queue
+import secrets
+import socket
+import threading
+import time
+import zlib
 import os
 
 app = Flask(__name__)
@@ -23,6 +39,29 @@ if database_url.startswith('postgres://'):
 app.config['SQLALCHEMY_DATABASE_URI'] = database_url
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['EARNINGS_CHUNK_SIZE'] = int(os.environ.get('EARNINGS_CHUNK_SIZE', 1000))  # users per committed chunk
+app.config['EARNINGS_WORKERS'] = int(os.environ.get('EARNINGS_WORKERS', 1))  # >1 enables the process pool
+app.config['EARNINGS_PROCESS_POOL'] = False  # set by processes that serve no requests, see scheduler.py
+app.config['EARNINGS_MAX_BACKFILL_DAYS'] = int(os.environ.get('EARNINGS_MAX_BACKFILL_DAYS', 31))  # missed days caught up per run
+app.config['EARNINGS_RETENTION_DAYS'] = int(os.environ.get('EARNINGS_RETENTION_DAYS', 180))  # raw daily rows kept before the monthly rollup
+app.config['EARNINGS_ROLLUP_BATCH_SIZE'] = int(os.environ.get('EARNINGS_ROLLUP_BATCH_SIZE', 10000))  # raw rows compacted per transaction
+app.config['SCHEDULER_LEASE_SECONDS'] = int(os.environ.get('SCHEDULER_LEASE_SECONDS', 90))  # leader lease, renewed every third of it
+app.config['SCHEDULER_MISFIRE_GRACE_SECONDS'] = int(os.environ.get('SCHEDULER_MISFIRE_GRACE_SECONDS', 12 * 3600))
+app.config['PAYMENT_CONFIG_TTL_SECONDS'] = int(os.environ.get('PAYMENT_CONFIG_TTL_SECONDS', 30))  # max staleness across workers
+app.config['USER_CACHE_SIZE'] = int(os.environ.get('USER_CACHE_SIZE', 10000))  # users kept by the login loader cache
+app.config['USER_CACHE_TTL_SECONDS'] = int(os.environ.get('USER_CACHE_TTL_SECONDS', 60))  # entries are reloaded after this
+app.config['USER_CACHE_STAMP_SECONDS'] = int(os.environ.get('USER_CACHE_STAMP_SECONDS', 2))  # max staleness across workers
+app.config['PLATFORM_STATS_RECOMPUTE_HOURS'] = int(os.environ.get('PLATFORM_STATS_RECOMPUTE_HOURS', 6))  # drift correction interval
+app.config['ADMIN_USERS_PAGE_SIZE'] = int(os.environ.get('ADMIN_USERS_PAGE_SIZE', 50))  # rows per admin users page
+app.config['ADMIN_PAYMENTS_PAGE_SIZE'] = int(os.environ.get('ADMIN_PAYMENTS_PAGE_SIZE', 50))  # rows per admin payments page
+app.config['EARNINGS_HISTORY_PAGE_SIZE'] = int(os.environ.get('EARNINGS_HISTORY_PAGE_SIZE', 50))  # rows per earnings history page
+app.config['ADMIN_CHAT_PAGE_SIZE'] = int(os.environ.get('ADMIN_CHAT_PAGE_SIZE', 50))  # conversations per admin inbox page
+app.config['CHAT_STREAM_HEARTBEAT_SECONDS'] = int(os.environ.get('CHAT_STREAM_HEARTBEAT_SECONDS', 15))  # keepalive and database catch-up interval
+app.config['CHAT_STREAM_MAX_SECONDS'] = int(os.environ.get('CHAT_STREAM_MAX_SECONDS', 300))  # clients reconnect after this
+app.config['REFERRAL_CODE_KEY'] = os.environ.get('REFERRAL_CODE_KEY')  # optional, must match the key stored with the counter
+app.config['REFERRAL_CODE_BLOCK_SIZE'] = int(os.environ.get('REFERRAL_CODE_BLOCK_SIZE', 100))  # codes reserved per database round trip
+app.config['CHAT_RETENTION_DAYS'] = int(os.environ.get('CHAT_RETENTION_DAYS', 90))  # live chat messages kept before archiving
+app.config['CHAT_ARCHIVE_BATCH_SIZE'] = int(os.environ.get('CHAT_ARCHIVE_BATCH_SIZE', 1000))  # messages archived per transaction
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
@@ -50,12 +89,20 @@ class User(UserMixin, db.Model):
     total_investment = db.Column(db.Float, default=0)
     total_earnings = db.Column(db.Float, default=0)
     referral_earnings = db.Column(db.Float, default=0)
+    daily_investment_rate = db.Column(db.Float, default=0)  # sum of daily returns of active investments
+    daily_referral_rate = db.Column(db.Float, default=0)  # sum of referral bonuses from referred users' active investments
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     investments = db.relationship('Investment', backref='user', lazy=True)
     daily_earnings = db.relationship('DailyEarning', backref='user', lazy=True)
     referrals = db.relationship('Referral', backref='referrer', lazy=True)
 
+    # Admin user listing keyset sorts, see ADMIN_USER_SORTS
+    __table_args__ = (
+        db.Index('ix_user_created_at_id', 'created_at', 'id'),
+        db.Index('ix_user_total_investment_created_at_id', 'total_investment', 'created_at', 'id'),
+    )
+
 class Investment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -64,6 +111,8 @@ class Investment(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
 
+    __table_args__ = (db.Index('ix_investment_user_id_is_active', 'user_id', 'is_active'),)
+
 class DailyEarning(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -72,6 +121,22 @@ class DailyEarning(db.Model):
     date = db.Column(db.Date, default=datetime.utcnow().date)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_daily_earning_user_id_date', 'user_id', 'date'),  # earnings history and totals
+        db.Index('ix_daily_earning_date', 'date'),  # earnings run idempotency check, today's earnings
+    )
+
+class DailyEarningRollup(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    month = db.Column(db.Date, nullable=False)  # first day of the month
+    earning_type = db.Column(db.String(20), nullable=False)  # 'investment' or 'referral'
+    amount = db.Column(db.Float, default=0)
+    row_count = db.Column(db.Integer, default=0)  # DailyEarning rows compacted into this one
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'month', 'earning_type', name='uq_daily_earning_rollup_user_month_type'),)
+
 class Referral(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     referrer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -80,6 +145,11 @@ class Referral(db.Model):
     bonus_earned = db.Column(db.Float, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_referral_referrer_id', 'referrer_id'),
+        db.Index('ix_referral_referred_user_id', 'referred_user_id'),
+    )
+
 class Wallet(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -88,6 +158,8 @@ class Wallet(db.Model):
     total_withdrawn = db.Column(db.Float, default=0)
     last_updated = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (db.Index('ix_wallet_user_id', 'user_id'),)
+
 class Withdrawal(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -104,6 +176,11 @@ class Withdrawal(db.Model):
     payment_time_hours = db.Column(db.Integer, nullable=True)
     payment_time_minutes = db.Column(db.Integer, nullable=True)
 
+    __table_args__ = (
+        db.Index('ix_withdrawal_status_requested_at', 'status', 'requested_at'),  # admin payments queue
+        db.Index('ix_withdrawal_user_id_requested_at', 'user_id', 'requested_at'),  # wallet history
+    )
+
 class ChatMessage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -112,6 +189,30 @@ class ChatMessage(db.Model):
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Conversations are read in id order, so polls and streams range-scan the messages after a cursor
+    __table_args__ = (db.Index('ix_chat_message_user_id_id', 'user_id', 'id'),)
+
+class ChatArchive(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    month = db.Column(db.Date, nullable=False)  # first day of the month
+    payload = db.Column(db.LargeBinary, nullable=False)  # zlib-compressed JSON list of the month's messages
+    message_count = db.Column(db.Integer, default=0)
+    first_message_id = db.Column(db.Integer)
+    last_message_id = db.Column(db.Integer)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'month', name='uq_chat_archive_user_month'),)
+
+class Conversation(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    last_message_id = db.Column(db.Integer, nullable=False)
+    last_message_at = db.Column(db.DateTime)
+    unread_count = db.Column(db.Integer, default=0)  # member messages the admin has not read
+
+    # The admin inbox lists conversations by their latest message
+    __table_args__ = (db.Index('ix_conversation_last_message_id', 'last_message_id'),)
+
 class PaymentConfig(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     admin_name = db.Column(db.String(100), default='EarnDaily Admin')
@@ -145,6 +246,11 @@ class PendingInvestment(db.Model):
     expires_at = db.Column(db.DateTime, nullable=True)
     confirmed_at = db.Column(db.DateTime, nullable=True)
 
+    __table_args__ = (
+        db.Index('ix_pending_investment_status_confirmed_at', 'status', 'confirmed_at'),  # admin payments queue
+        db.Index('ix_pending_investment_user_id', 'user_id'),
+    )
+
 class PasswordReset(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -153,16 +259,359 @@ class PasswordReset(db.Model):
     expires_at = db.Column(db.DateTime, nullable=False)
     is_used = db.Column(db.Boolean, default=False)
 
+class UserSummary(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    active_investment_count = db.Column(db.Integer, default=0)
+    daily_earning = db.Column(db.Float, default=0)  # daily return of the user's active investments
+    referral_count = db.Column(db.Integer, default=0)
+    referral_bonus = db.Column(db.Float, default=0)  # daily bonus from referred users' active investments
+    earnings_date = db.Column(db.Date, nullable=True)  # day that today_earnings belongs to
+    today_earnings = db.Column(db.Float, default=0)
+    pending_withdrawal_count = db.Column(db.Integer, default=0)
+    pending_withdrawal_total = db.Column(db.Float, default=0)
+    wallet_balance = db.Column(db.Float, default=0)  # balance of the user's first wallet
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Admin user listing sorts, read in index order one page at a time
+    __table_args__ = (
+        db.Index('ix_user_summary_wallet_balance_user_id', 'wallet_balance', 'user_id'),
+        db.Index('ix_user_summary_referral_count_user_id', 'referral_count', 'user_id'),
+    )
+
+class PlatformStats(db.Model):
+    id = db.Column(db.Integer, primary_key=True)  # single row, PLATFORM_STATS_ID
+    total_users = db.Column(db.Integer, default=0)
+    total_investments = db.Column(db.Float, default=0)  # amount of every investment ever approved
+    daily_payouts = db.Column(db.Float, default=0)  # daily return of active investments
+    total_referrals = db.Column(db.Integer, default=0)
+    total_withdrawals = db.Column(db.Float, default=0)  # amount of completed withdrawals
+    pending_withdrawals = db.Column(db.Integer, default=0)
+    total_earnings_paid = db.Column(db.Float, default=0)  # accrued by earnings runs
+    active_investors = db.Column(db.Integer, default=0)  # users with an active investment
+    referrers = db.Column(db.Integer, default=0)  # users who referred someone
+    total_wallet_balance = db.Column(db.Float, default=0)
+    recomputed_at = db.Column(db.DateTime, nullable=True)
+
+PLATFORM_STATS_ID = 1
+
+class ReferralCodeCounter(db.Model):
+    id = db.Column(db.Integer, primary_key=True)  # single row, REFERRAL_CODE_COUNTER_ID
+    next_number = db.Column(db.Integer, default=0)  # sequence numbers below this are reserved by some process
+    permutation_key = db.Column(db.String(64), nullable=True)  # orders the code space, set when the row is created
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+REFERRAL_CODE_COUNTER_ID = 1
+
+class EarningsRun(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    run_date = db.Column(db.Date, unique=True, nullable=False)
+    status = db.Column(db.String(20), default='running')  # running, completed
+    chunk_size = db.Column(db.Integer, nullable=False)
+    batch_run_id = db.Column(db.Integer, nullable=True)  # id of the oldest run accrued together with this one
+    last_user_id = db.Column(db.Integer, default=0)  # checkpoint: users with id <= last_user_id are done
+    users_processed = db.Column(db.Integer, default=0)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    investment_total = db.Column(db.Float, default=0)
+    referral_total = db.Column(db.Float, default=0)
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+class EarningsRunShard(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.Integer, db.ForeignKey('earnings_run.id'), nullable=False)
+    first_user_id = db.Column(db.Integer, nullable=False)
+    last_user_id = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), default='pending')  # pending, completed
+    users_processed = db.Column(db.Integer, default=0)
+    investment_total = db.Column(db.Float, default=0)
+    referral_total = db.Column(db.Float, default=0)
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+class EarningsJobReport(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    started_at = db.Column(db.DateTime, nullable=False)
+    finished_at = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(20), nullable=False)  # completed, failed
+    run_dates = db.Column(db.Text, nullable=True)  # comma separated dates accrued by the job
+    duration_seconds = db.Column(db.Float, default=0)
+    users_processed = db.Column(db.Integer, default=0)
+    users_per_second = db.Column(db.Float, default=0)
+    rows_touched = db.Column(db.Integer, default=0)
+    sql_statements = db.Column(db.Integer, default=0)
+    phases = db.Column(db.Text, nullable=True)  # JSON: phase name -> seconds
+    error = db.Column(db.Text, nullable=True)
+
+class UserCacheStamp(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)  # bumped by every transaction that writes users
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+USER_CACHE_STAMP_ID = 1
+
+class SchedulerLease(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    holder = db.Column(db.String(120), nullable=False)  # hostname:pid of the leading process
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+SCHEDULER_LEASE_NAME = 'scheduler'
+SCHEDULER_HOLDER = f'{socket.gethostname()}:{os.getpid()}'
+
+class UserIdentityCache:
+    """Per-process LRU of user column values for the login loader.
+
+    Entries expire after USER_CACHE_TTL_SECONDS and at most USER_CACHE_SIZE
+    users are kept. Changes made through this process drop the affected
+    entries when their transaction ends. Every transaction that writes users
+    also bumps the user_cache_stamp row; sync() compares it at most every
+    USER_CACHE_STAMP_SECONDS and drops every entry when another process has
+    written users, so a user deleted or changed elsewhere is not served from
+    here for longer than that.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.stamp = None
+        self.stamp_checked_at = 0
+
+    def sync(self):
+        """Drop every entry if the user_cache_stamp row changed since it was last compared"""
+        with self.lock:
+            if time.monotonic() - self.stamp_checked_at < app.config['USER_CACHE_STAMP_SECONDS']:
+                return
+            self.stamp_checked_at = time.monotonic()
+        stamp = db.session.execute(
+            select(UserCacheStamp.version).where(UserCacheStamp.id == USER_CACHE_STAMP_ID)
+        ).scalar()
+        with self.lock:
+            if stamp != self.stamp:
+                self.generation += 1
+                self.entries.clear()
+                self.stamp = stamp
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is not None and time.monotonic() - entry[0] < app.config['USER_CACHE_TTL_SECONDS']:
+                self.entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.entries.pop(user_id, None)
+            self.misses += 1
+            return None
+
+    def put(self, user_id, values, generation):
+        """Store values read while the cache was at generation, unless it has been invalidated since"""
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.entries[user_id] = (time.monotonic(), values)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > app.config['USER_CACHE_SIZE']:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, user_id=None):
+        """Drop one user, or every user when user_id is None"""
+        with self.lock:
+            self.generation += 1
+            if user_id is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(user_id, None)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'max_size': app.config['USER_CACHE_SIZE'],
+                'ttl_seconds': app.config['USER_CACHE_TTL_SECONDS'],
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None
+            }
+
+user_identity_cache = UserIdentityCache()
+USER_CACHE_ATTRIBUTES = [attribute.key for attribute in inspect(User).column_attrs]
+
+def written_user_ids(session):
+    """Ids of the users written in the session's current transaction; None stands for every user"""
+    return session.info.setdefault('written_user_ids', set())
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def collect_written_user(mapper, connection, target):
+    written_user_ids(object_session(target)).add(target.id)
+
+@event.listens_for(db.session, 'do_orm_execute')
+def collect_bulk_written_users(orm_execute_state):
+    """Bulk UPDATE/DELETE statements on users bypass the mapper events, so every entry goes"""
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) and any(
+        mapper.class_ is User for mapper in orm_execute_state.all_mappers
+    ):
+        written_user_ids(orm_execute_state.session).add(None)
+
+@event.listens_for(db.session, 'before_commit')
+def stamp_written_users(session):
+    """Bump the user cache stamp in the transaction that writes users, for the other processes' caches"""
+    if session.in_nested_transaction():
+        return
+    # Flush first, so the writes still pending at commit are collected too
+    session.flush()
+    if session.info.get('written_user_ids'):
+        session.execute(
+            update(UserCacheStamp).where(UserCacheStamp.id == USER_CACHE_STAMP_ID).values(
+                version=UserCacheStamp.version + 1,
+                updated_at=datetime.utcnow()
+            )
+        )
+
+@event.listens_for(db.session, 'after_commit')
+@event.listens_for(db.session, 'after_rollback')
+def invalidate_written_users(session):
+    """Drop the cache entries of the users written by the transaction that just ended.
+
+    Dropping them at flush time would let another request cache the old row
+    again before the commit. Rolled back writes are dropped as well, in case
+    this session read and cached them before the rollback.
+    """
+    if session.in_nested_transaction():
+        # Savepoints end inside the transaction; their users go with it
+        return
+    user_ids = session.info.pop('written_user_ids', None)
+    if not user_ids:
+        return
+    if None in user_ids:
+        user_identity_cache.invalidate()
+    else:
+        for user_id in user_ids:
+            user_identity_cache.invalidate(user_id)
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    user_identity_cache.sync()
+    values = user_identity_cache.get(user_id)
+    if values is not None:
+        # Attach a copy of the cached row to this request's session without querying it
+        user = User(**values)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+    
+    generation = user_identity_cache.generation
+    user = db.session.get(User, user_id)
+    if user is not None:
+        user_identity_cache.put(user_id, {key: getattr(user, key) for key in USER_CACHE_ATTRIBUTES}, generation)
+    return user
+
+REFERRAL_CODE_SPACE = 10 ** 7  # 7-digit codes
+REFERRAL_CODE_HALF_BITS = 12  # the cipher permutes 24-bit values, the smallest even width above the code space
+REFERRAL_CODE_ROUNDS = 4
+
+def permute_referral_number(value, key):
+    """Balanced Feistel cipher over 24-bit values, keyed with HMAC-SHA256 round functions"""
+    mask = (1 << REFERRAL_CODE_HALF_BITS) - 1
+    left, right = value >> REFERRAL_CODE_HALF_BITS, value & mask
+    for round_number in range(REFERRAL_CODE_ROUNDS):
+        digest = hmac.new(key, f'{round_number}:{right}'.encode(), hashlib.sha256).digest()
+        left, right = right, left ^ (int.from_bytes(digest[:4], 'big') & mask)
+    return (left << REFERRAL_CODE_HALF_BITS) | right
+
+def referral_code_for(sequence_number, key):
+    """The referral code of a sequence number in range(REFERRAL_CODE_SPACE) under a permutation key.
+
+    Cycle walking re-encrypts values that fall outside the code space, which
+    restricts the 24-bit permutation to a permutation of the 7-digit codes, so
+    distinct sequence numbers always give distinct codes.
+    """
+    value = sequence_number
+    while True:
+        value = permute_referral_number(value, key.encode())
+        if value < REFERRAL_CODE_SPACE:
+            return f'{value:07d}'
+
+def reserve_referral_numbers(count):
+    """Reserve count sequence numbers in their own transaction.
+
+    Returns the first number and the permutation key stored in the counter
+    row. The first reservation creates the row with REFERRAL_CODE_KEY, or a
+    random key when it is not set, so every process and every later
+    deployment orders the code space the same way. A configured key that
+    differs from the stored one raises instead of handing out codes in
+    another order.
+    """
+    with db.engine.begin() as connection:
+        reserve = update(ReferralCodeCounter).where(ReferralCodeCounter.id == REFERRAL_CODE_COUNTER_ID).values(
+            next_number=ReferralCodeCounter.next_number + count, updated_at=datetime.utcnow()
+        )
+        if connection.execute(reserve).rowcount:
+            next_number, key = connection.execute(
+                select(ReferralCodeCounter.next_number, ReferralCodeCounter.permutation_key).where(
+                    ReferralCodeCounter.id == REFERRAL_CODE_COUNTER_ID
+                )
+            ).one()
+            if app.config['REFERRAL_CODE_KEY'] and app.config['REFERRAL_CODE_KEY'] != key:
+                raise RuntimeError('REFERRAL_CODE_KEY differs from the key stored in referral_code_counter')
+            return next_number - count, key
+    key = app.config['REFERRAL_CODE_KEY'] or secrets.token_hex(32)
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(insert(ReferralCodeCounter).values(
+                id=REFERRAL_CODE_COUNTER_ID, next_number=count, permutation_key=key, updated_at=datetime.utcnow()
+            ))
+        return 0, key
+    except IntegrityError:
+        # Another process created the counter first
+        return reserve_referral_numbers(count)
+
+class ReferralCodeAllocator:
+    """Process-local block of referral code sequence numbers.
+
+    A block of REFERRAL_CODE_BLOCK_SIZE numbers is reserved from the counter
+    row at a time, so most codes are handed out without touching the database.
+    Numbers left in the block when the process exits are never used.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.next_number = 0
+        self.block_end = 0
+        self.key = None
+
+    def next_code(self):
+        with self.lock:
+            if self.next_number >= self.block_end:
+                block_size = app.config['REFERRAL_CODE_BLOCK_SIZE']
+                self.next_number, self.key = reserve_referral_numbers(block_size)
+                self.block_end = self.next_number + block_size
+            number, key = self.next_number, self.key
+            self.next_number += 1
+        if number >= REFERRAL_CODE_SPACE:
+            raise RuntimeError('The referral code space is exhausted')
+        return referral_code_for(number, key)
+
+referral_code_allocator = ReferralCodeAllocator()
 
 def generate_referral_code():
     """Generate a unique 7-digit referral code"""
-    while True:
-        code = ''.join(random.choices(string.digits, k=7))
-        if not User.query.filter_by(referral_code=code).first():
-            return code
+    return referral_code_allocator.next_code()
+
+def referral_code_usage():
+    """How much of the 7-digit referral code space is reserved and assigned"""
+    reserved = db.session.execute(
+        select(ReferralCodeCounter.next_number).where(ReferralCodeCounter.id == REFERRAL_CODE_COUNTER_ID)
+    ).scalar() or 0
+    assigned = db.session.execute(select(db.func.count(User.id))).scalar()
+    return {
+        'code_space': REFERRAL_CODE_SPACE,
+        'reserved': reserved,
+        'assigned': assigned,
+        'remaining': REFERRAL_CODE_SPACE - reserved,
+        'reserved_percent': round(reserved / REFERRAL_CODE_SPACE * 100, 4),
+        'assigned_percent': round(assigned / REFERRAL_CODE_SPACE * 100, 4)
+    }
 
 def calculate_daily_return(amount):
     """Calculate daily return based on investment amount"""
@@ -188,6 +637,366 @@ def calculate_referral_bonus(investment_amount):
     else:
         return 0
 
+def calculate_daily_returns(amounts):
+    """Vectorized calculate_daily_return over an array of investment amounts"""
+    amounts = np.asarray(amounts, dtype=float)
+    return np.select(
+        [amounts >= 2000, amounts >= 1000, amounts >= 500],
+        [amounts * 0.075, 70.0, 30.0],
+        default=0.0
+    )
+
+def calculate_referral_bonuses(investment_amounts):
+    """Vectorized calculate_referral_bonus over an array of investment amounts"""
+    investment_amounts = np.asarray(investment_amounts, dtype=float)
+    return np.select(
+        [investment_amounts >= 2000, investment_amounts >= 1000, investment_amounts >= 500],
+        [investment_amounts * 0.03, 25.0, 10.0],
+        default=0.0
+    )
+
+def sum_by_user(user_ids, values):
+    """Sum values per user id, returning {user_id: total}"""
+    unique_ids, positions = np.unique(np.asarray(user_ids, dtype=np.int64), return_inverse=True)
+    totals = np.bincount(positions, weights=values, minlength=len(unique_ids))
+    return dict(zip(unique_ids.tolist(), totals.tolist()))
+
+def active_investment_columns(*criteria):
+    """Load (user_ids, amounts) arrays of active investments in one query"""
+    rows = db.session.execute(
+        select(Investment.user_id, Investment.amount).where(Investment.is_active.is_(True), *criteria)
+    ).all()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=float)
+    user_ids, amounts = zip(*rows)
+    return np.asarray(user_ids, dtype=np.int64), np.asarray(amounts, dtype=float)
+
+OPEN_WITHDRAWAL_STATUSES = ('pending', 'processing', 'awaiting_confirmation')
+
+def forecast_payouts(days, now=None):
+    """Project investment payouts, referral payouts and withdrawal outflow for the next days.
+
+    Active investments, and the referral edges pointing at them, are counted per
+    distinct amount in SQL; the tier rules are then applied to those amounts as
+    arrays, so the cost barely grows with the number of investments.
+    """
+    now = now or datetime.utcnow()
+    investment_counts = db.session.execute(
+        select(Investment.amount, db.func.count(Investment.id)).join(
+            User, User.id == Investment.user_id
+        ).where(Investment.is_active.is_(True)).group_by(Investment.amount)
+    ).all()
+    
+    # Each referral row earns its referrer the bonus of every active investment of the referred user
+    referred_user = aliased(User)
+    referral_counts = db.session.execute(
+        select(Investment.amount, db.func.count(Investment.id)).select_from(Referral).join(
+            User, User.id == Referral.referrer_id
+        ).join(
+            referred_user, referred_user.id == Referral.referred_user_id
+        ).join(
+            Investment, Investment.user_id == Referral.referred_user_id
+        ).where(Investment.is_active.is_(True)).group_by(Investment.amount)
+    ).all()
+    
+    def weighted_total(rows, calculator):
+        if not rows:
+            return 0.0
+        amounts, counts = np.asarray(rows, dtype=float).T
+        return float(np.dot(calculator(amounts), counts))
+    
+    investment_payouts = np.full(days, weighted_total(investment_counts, calculate_daily_returns))
+    referral_payouts = np.full(days, weighted_total(referral_counts, calculate_referral_bonuses))
+    
+    # Open withdrawals fall due processing_time hours after the request; overdue ones count on day one
+    withdrawal_outflow = np.zeros(days)
+    withdrawals = db.session.execute(
+        select(Withdrawal.amount, Withdrawal.requested_at, Withdrawal.processing_time).where(
+            Withdrawal.status.in_(OPEN_WITHDRAWAL_STATUSES)
+        )
+    ).all()
+    if withdrawals:
+        amounts = np.array([withdrawal.amount for withdrawal in withdrawals], dtype=float)
+        hours_until_due = np.array([
+            ((withdrawal.requested_at or now) - now).total_seconds() / 3600 + (withdrawal.processing_time or 24)
+            for withdrawal in withdrawals
+        ])
+        due_day = np.maximum(np.ceil(hours_until_due / 24), 1).astype(int) - 1
+        within = due_day < days
+        withdrawal_outflow = np.bincount(due_day[within], weights=amounts[within], minlength=days)
+    
+    daily_total = investment_payouts + referral_payouts + withdrawal_outflow
+    return {
+        'days': [(now.date() + timedelta(days=offset + 1)).isoformat() for offset in range(days)],
+        'investment_payouts': investment_payouts.tolist(),
+        'referral_payouts': referral_payouts.tolist(),
+        'withdrawal_outflow': withdrawal_outflow.tolist(),
+        'cumulative_total': np.cumsum(daily_total).tolist(),
+        'totals': {
+            'investment_payouts': float(investment_payouts.sum()),
+            'referral_payouts': float(referral_payouts.sum()),
+            'withdrawal_outflow': float(withdrawal_outflow.sum()),
+            'total': float(daily_total.sum())
+        }
+    }
+
+def daily_return_expr(amount):
+    """SQL expression mirroring calculate_daily_return for set-based queries"""
+    return case(
+        (amount >= 2000, amount * 0.075),
+        (amount >= 1000, 70.0),
+        (amount >= 500, 30.0),
+        else_=0.0
+    )
+
+def referral_bonus_expr(investment_amount):
+    """SQL expression mirroring calculate_referral_bonus for set-based queries"""
+    return case(
+        (investment_amount >= 2000, investment_amount * 0.03),
+        (investment_amount >= 1000, 25.0),
+        (investment_amount >= 500, 10.0),
+        else_=0.0
+    )
+
+PaymentSettings = namedtuple('PaymentSettings', ['id', 'admin_name', 'upi_id', 'qr_code_path', 'updated_at'])
+
+class PaymentConfigCache:
+    """Process-local snapshot of the payment configuration row.
+
+    Within the TTL the snapshot is served without touching the database. After
+    it, a single-column query compares the row's updated_at stamp and reloads
+    only if another worker changed the settings, so every worker sees a change
+    within PAYMENT_CONFIG_TTL_SECONDS.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.settings = None
+        self.checked_at = 0
+
+    def get(self):
+        ttl = app.config['PAYMENT_CONFIG_TTL_SECONDS']
+        with self.lock:
+            settings, checked_at = self.settings, self.checked_at
+        if settings is not None and time.monotonic() - checked_at < ttl:
+            return settings
+
+        stamp = db.session.execute(
+            select(PaymentConfig.id, PaymentConfig.updated_at).order_by(PaymentConfig.id).limit(1)
+        ).first()
+        if settings is None or stamp is None or tuple(stamp) != (settings.id, settings.updated_at):
+            settings = self.load()
+        with self.lock:
+            self.settings, self.checked_at = settings, time.monotonic()
+        return settings
+
+    def load(self):
+        """Read the configuration row, creating it with defaults if there is none"""
+        config = PaymentConfig.query.order_by(PaymentConfig.id).first()
+        if not config:
+            config = PaymentConfig()
+            db.session.add(config)
+            db.session.commit()
+        return PaymentSettings(config.id, config.admin_name, config.upi_id, config.qr_code_path, config.updated_at)
+
+    def invalidate(self):
+        with self.lock:
+            self.settings = None
+
+payment_config_cache = PaymentConfigCache()
+
+def get_payment_config():
+    """Read-only payment configuration shared by the payment pages"""
+    return payment_config_cache.get()
+
+class LocalChatBroker:
+    """In-process publish/subscribe for new chat messages.
+
+    Streams only use notifications to wake up early and read the new rows
+    from the database, so a missed or dropped notification delays a message
+    by at most one heartbeat. Only streams served by the publishing process
+    are notified; several web processes can share a broker with the same
+    publish/subscribe/unsubscribe methods instead, assigned to chat_broker.
+    """
+    
+    def __init__(self, max_pending=100):
+        self.max_pending = max_pending
+        self.lock = threading.Lock()
+        self.subscribers = {}
+    
+    def subscribe(self, channel):
+        """Queue that receives the events published on channel from now on"""
+        subscription = queue.Queue(maxsize=self.max_pending)
+        with self.lock:
+            self.subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+    
+    def unsubscribe(self, channel, subscription):
+        with self.lock:
+            subscriptions = self.subscribers.get(channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self.subscribers[channel]
+    
+    def publish(self, channel, event):
+        with self.lock:
+            subscriptions = list(self.subscribers.get(channel, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.put_nowait(event)
+            except queue.Full:
+                # The stream is behind and catches up from the database anyway
+                pass
+
+chat_broker = LocalChatBroker()
+
+ADMIN_CHAT_CHANNEL = 'admin'
+CHAT_STREAM_BATCH_SIZE = 100  # messages read per stream catch-up query
+
+def user_chat_channel(user_id):
+    return f'user:{user_id}'
+
+def chat_message_payload(message, username=None):
+    """JSON-ready form of a ChatMessage for the chat endpoints and streams"""
+    payload = {
+        'id': message.id,
+        'user_id': message.user_id,
+        'message': message.message,
+        'is_admin_reply': message.is_admin_reply,
+        'created_at': message.created_at.isoformat()
+    }
+    if username is not None:
+        payload['username'] = username
+    return payload
+
+def publish_chat_message(message):
+    """Notify the member's and the admin's streams of a committed ChatMessage"""
+    payload = chat_message_payload(message)
+    chat_broker.publish(user_chat_channel(message.user_id), payload)
+    chat_broker.publish(ADMIN_CHAT_CHANNEL, payload)
+
+def record_chat_message(message):
+    """Move the message's conversation to it in the caller's transaction; nothing is committed.
+
+    The conversation row is changed by a single UPDATE relative to its current
+    values, so concurrent messages of the same member queue on the row instead
+    of overwriting each other's counts.
+    """
+    db.session.flush()
+    unread = 0 if message.is_admin_reply or message.is_read else 1
+    is_latest = Conversation.last_message_id < message.id
+    statement = update(Conversation).where(Conversation.user_id == message.user_id).values(
+        last_message_id=case((is_latest, message.id), else_=Conversation.last_message_id),
+        last_message_at=case((is_latest, message.created_at), else_=Conversation.last_message_at),
+        unread_count=Conversation.unread_count + unread
+    ).execution_options(synchronize_session=False)
+    if db.session.execute(statement).rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(Conversation(
+                user_id=message.user_id,
+                last_message_id=message.id,
+                last_message_at=message.created_at,
+                unread_count=unread
+            ))
+    except IntegrityError:
+        # Another process opened the conversation first
+        db.session.execute(statement)
+
+def conversation_rows():
+    """Select conversation rows computed from the chat messages of every member"""
+    latest = select(
+        ChatMessage.user_id.label('user_id'),
+        db.func.max(ChatMessage.id).label('last_message_id'),
+        db.func.count(case((ChatMessage.is_read.is_(False) & ChatMessage.is_admin_reply.is_(False), 1))).label('unread_count')
+    ).group_by(ChatMessage.user_id).subquery()
+    return select(
+        latest.c.user_id, latest.c.last_message_id, ChatMessage.created_at, latest.c.unread_count
+    ).join(ChatMessage, ChatMessage.id == latest.c.last_message_id)
+
+def rebuild_conversations():
+    """Recompute every conversation in a single transaction"""
+    db.session.execute(delete(Conversation).execution_options(synchronize_session=False))
+    db.session.execute(insert(Conversation).from_select(
+        ['user_id', 'last_message_id', 'last_message_at', 'unread_count'], conversation_rows()
+    ))
+    db.session.commit()
+
+def chat_conversation_etag(user_id, after_id):
+    """ETag of a conversation's messages after after_id, from an index lookup of its newest message id"""
+    last_id = db.session.query(db.func.max(ChatMessage.id)).filter(ChatMessage.user_id == user_id).scalar() or 0
+    return f'chat-{user_id}-{after_id}-{last_id}'
+
+def conditional_json(etag, build_payload):
+    """JSON response of build_payload() tagged with a weak etag, or a bodyless 304 if the client has it.
+
+    The payload is only built when the client's If-None-Match differs.
+    """
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(build_payload())
+    response.set_etag(etag, weak=True)
+    # Browsers revalidate every time instead of reusing a possibly stale copy
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def sse_event(data, event_id=None):
+    """One Server-Sent Events message carrying data as JSON"""
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines.append('data: ' + json.dumps(data))
+    return '\n'.join(lines) + '\n\n'
+
+def chat_event_stream(channel, new_messages, last_id):
+    """Server-Sent Events of the chat messages after last_id, as they are committed.
+
+    new_messages(last_id) returns the payloads of up to CHAT_STREAM_BATCH_SIZE
+    newer messages in id order. It runs after every notification on channel
+    and at least once per heartbeat. The stream ends after CHAT_STREAM_MAX_SECONDS and the
+    browser reconnects from the last event id. The database session is
+    closed between reads so an open stream holds no connection.
+    """
+    heartbeat = app.config['CHAT_STREAM_HEARTBEAT_SECONDS']
+    deadline = time.monotonic() + app.config['CHAT_STREAM_MAX_SECONDS']
+    subscription = chat_broker.subscribe(channel)
+    try:
+        yield f'retry: {heartbeat * 1000}\n\n'
+        while True:
+            payloads = new_messages(last_id)
+            db.session.close()
+            for payload in payloads:
+                last_id = payload['id']
+                yield sse_event(payload, last_id)
+            if time.monotonic() >= deadline:
+                return
+            if len(payloads) >= CHAT_STREAM_BATCH_SIZE:
+                continue
+            try:
+                subscription.get(timeout=heartbeat)
+                # Several messages committed together are read in one query
+                while not subscription.empty():
+                    subscription.get_nowait()
+            except queue.Empty:
+                yield ': keepalive\n\n'
+    finally:
+        chat_broker.unsubscribe(channel, subscription)
+
+def encode_cursor(values):
+    """Opaque, URL-safe pagination cursor for the sort key values of the last row of a page"""
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+def decode_cursor(cursor):
+    """Sort key values of a cursor made by encode_cursor, or None for a missing or malformed one"""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) else None
+
 def get_referral_income_info():
     """Get referral income information for display"""
     return {
@@ -197,11 +1006,12 @@ def get_referral_income_info():
     }
 
 def generate_reset_token():
-    """Generate a unique reset token"""
-    while True:
-        token = ''.join(random.choices(string.ascii_letters + string.digits, k=32))
-        if not PasswordReset.query.filter_by(reset_token=token).first():
-            return token
+    """Generate a unique reset token.
+
+    256 random bits make a collision with an existing token practically
+    impossible, so the token is not looked up first.
+    """
+    return secrets.token_urlsafe(32)
 
 # Routes
 @app.route('/')
@@ -234,16 +1044,27 @@ def register():
                 return render_template('register.html')
         
         # Create new user
-        user = User(
-            username=username,
-            email=email,
-            password_hash=generate_password_hash(password),
-            referral_code=generate_referral_code(),
-            referred_by=referral_code_used if referrer else None
-        )
-        
-        db.session.add(user)
-        db.session.commit()
+        password_hash = generate_password_hash(password)
+        for attempt in range(3):
+            user = User(
+                username=username,
+                email=email,
+                password_hash=password_hash,
+                referral_code=generate_referral_code(),
+                referred_by=referral_code_used if referrer else None
+            )
+            try:
+                db.session.add(user)
+                bump_platform_stats(total_users=1)
+                db.session.commit()
+                break
+            except IntegrityError:
+                # The code was handed out at random before codes came from the sequence,
+                # or the username or email was registered at the same time
+                db.session.rollback()
+        else:
+            flash('Registration failed, please try again')
+            return render_template('register.html')
         
         # Create referral record if user was referred
         if referrer:
@@ -253,7 +1074,9 @@ def register():
                 referral_code=referral_code_used
             )
             db.session.add(referral)
-            db.session.commit()
+            bump_platform_stats(total_referrals=1)
+        refresh_user_summaries([user.id, referrer.id] if referrer else [user.id])
+        db.session.commit()
         
         flash('Registration successful! Please login.')
         return redirect(url_for('login'))
@@ -342,7 +1165,7 @@ def reset_password(token):
             return render_template('reset_password.html', token=token)
         
         # Update user password
-        user = User.query.get(password_reset.user_id)
+        user = db.session.get(User, password_reset.user_id, populate_existing=True)
         if not user:
             flash('User not found. Please try again or contact support.')
             return redirect(url_for('login'))
@@ -362,27 +1185,14 @@ def reset_password(token):
 @login_required
 def dashboard():
     user_investments = Investment.query.filter_by(user_id=current_user.id, is_active=True).all()
-    total_daily_earning = sum([calculate_daily_return(inv.amount) for inv in user_investments])
-    
-    # Get referral count and bonus
-    referrals = Referral.query.filter_by(referrer_id=current_user.id).all()
-    referral_count = len(referrals)
-    
-    # Calculate referral bonus from referred users' investments
-    referral_bonus = 0
-    for referral in referrals:
-        referred_user = User.query.get(referral.referred_user_id)
-        if referred_user:
-            user_investments_referred = Investment.query.filter_by(user_id=referred_user.id, is_active=True).all()
-            for inv in user_investments_referred:
-                referral_bonus += calculate_referral_bonus(inv.amount)
+    summary = get_user_summary(current_user.id)
     
     return render_template('dashboard.html', 
                          user=current_user,
                          investments=user_investments,
-                         total_daily_earning=total_daily_earning,
-                         referral_count=referral_count,
-                         referral_bonus=referral_bonus)
+                         total_daily_earning=summary.daily_earning,
+                         referral_count=summary.referral_count,
+                         referral_bonus=summary.referral_bonus)
 
 @app.route('/invest', methods=['GET', 'POST'])
 @login_required
@@ -443,8 +1253,7 @@ def profile():
 @login_required
 def referral_share():
     """Dedicated referral sharing page"""
-    referrals = Referral.query.filter_by(referrer_id=current_user.id).all()
-    referral_count = len(referrals)
+    referral_count = get_user_summary(current_user.id).referral_count
     
     # Calculate potential earnings
     potential_earnings = {
@@ -461,8 +1270,20 @@ def referral_share():
 @app.route('/earnings')
 @login_required
 def earnings():
-    earnings = DailyEarning.query.filter_by(user_id=current_user.id).order_by(DailyEarning.date.desc()).all()
-    return render_template('earnings.html', earnings=earnings)
+    date_from = parse_date_arg(request.args, 'date_from')
+    date_to = parse_date_arg(request.args, 'date_to')
+    page_size = min(max(request.args.get('limit', app.config['EARNINGS_HISTORY_PAGE_SIZE'], type=int), 1), 200)
+    cursor = decode_cursor(request.args.get('after'))
+    
+    history = earnings_history(current_user.id, date_from, date_to)
+    earnings, next_cursor = earnings_history_page(history, cursor, page_size)
+    return render_template('earnings.html',
+                         earnings=earnings,
+                         totals=earnings_totals(history),
+                         page_size=page_size,
+                         next_cursor=next_cursor,
+                         is_first_page=cursor is None,
+                         is_filtered=bool(date_from or date_to))
 
 @app.route('/admin')
 @login_required
@@ -473,20 +1294,12 @@ def admin_panel():
         return redirect(url_for('dashboard'))
     
     try:
-        # Get basic statistics
-        total_users = User.query.count()
-        total_investments = db.session.query(db.func.sum(Investment.amount)).scalar() or 0
-        total_referrals = Referral.query.count()
-        
-        # Calculate daily payouts
-        daily_payouts = 0
-        try:
-            active_investments = Investment.query.filter_by(is_active=True).all()
-            for inv in active_investments:
-                daily_payouts += calculate_daily_return(inv.amount)
-        except Exception as investment_error:
-            print(f"Error calculating daily payouts: {investment_error}")
-            daily_payouts = 0
+        # Platform totals are maintained incrementally by the write paths
+        stats = get_platform_stats()
+        total_users = stats.total_users
+        total_investments = stats.total_investments
+        total_referrals = stats.total_referrals
+        daily_payouts = stats.daily_payouts
         
         # Get recent users
         recent_users = User.query.order_by(User.created_at.desc()).limit(10).all()
@@ -495,12 +1308,16 @@ def admin_panel():
         top_investors = []
         try:
             top_investors = User.query.order_by(User.total_investment.desc()).limit(5).all()
+            try:
+                investor_ids, investor_amounts = active_investment_columns(
+                    Investment.user_id.in_([user.id for user in top_investors])
+                )
+                daily_earnings = sum_by_user(investor_ids, calculate_daily_returns(investor_amounts))
+            except Exception as earning_error:
+                print(f"Error calculating daily earnings of top investors: {earning_error}")
+                daily_earnings = {}
             for user in top_investors:
-                try:
-                    user.daily_earning = sum([calculate_daily_return(inv.amount) for inv in user.investments if inv.is_active])
-                except Exception as earning_error:
-                    print(f"Error calculating daily earning for user {user.id}: {earning_error}")
-                    user.daily_earning = 0
+                user.daily_earning = daily_earnings.get(user.id, 0)
         except Exception as top_investors_error:
             print(f"Error getting top investors: {top_investors_error}")
             top_investors = []
@@ -519,29 +1336,26 @@ def admin_panel():
             print(f"Error getting top referrers: {top_referrers_error}")
             top_referrers = []
         
-        # Get withdrawal statistics with error handling
-        total_withdrawals = 0
-        pending_withdrawals = 0
+        # Project payout liabilities for the coming days
+        forecast_days = min(max(request.args.get('forecast_days', 7, type=int), 1), 365)
+        forecast = None
         try:
-            total_withdrawals = db.session.query(db.func.sum(Withdrawal.amount)).filter(
-                Withdrawal.status == 'completed'
-            ).scalar() or 0
-            pending_withdrawals = Withdrawal.query.filter_by(status='pending').count()
-        except Exception as withdrawal_stats_error:
-            print(f"Error getting withdrawal statistics: {withdrawal_stats_error}")
-            total_withdrawals = 0
-            pending_withdrawals = 0
+            forecast = forecast_payouts(forecast_days)
+        except Exception as forecast_error:
+            print(f"Error forecasting payouts: {forecast_error}")
         
         return render_template('admin.html',
                              total_users=total_users,
                              total_investments=total_investments,
                              daily_payouts=daily_payouts,
                              total_referrals=total_referrals,
-                             total_withdrawals=total_withdrawals,
-                             pending_withdrawals=pending_withdrawals,
+                             total_withdrawals=stats.total_withdrawals,
+                             pending_withdrawals=stats.pending_withdrawals,
+                             total_earnings_paid=stats.total_earnings_paid,
                              recent_users=recent_users,
                              top_investors=top_investors,
-                             top_referrers=top_referrers)
+                             top_referrers=top_referrers,
+                             forecast=forecast)
                              
     except Exception as e:
         print(f"Database error in admin panel: {e}")
@@ -554,9 +1368,58 @@ def admin_panel():
                              total_referrals=0,
                              total_withdrawals=0,
                              pending_withdrawals=0,
+                             total_earnings_paid=0,
                              recent_users=[],
                              top_investors=[],
-                             top_referrers=[])
+                             top_referrers=[],
+                             forecast=None)
+
+@app.route('/admin/forecast')
+@login_required
+def admin_forecast():
+    if current_user.username != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    days = min(max(request.args.get('days', 30, type=int), 1), 365)
+    return jsonify(forecast_payouts(days))
+
+@app.route('/admin/earnings-runs')
+@login_required
+def admin_earnings_runs():
+    if current_user.username != 'admin':
+        flash('Access denied. Admin privileges required.')
+        return redirect(url_for('dashboard'))
+    
+    reports = EarningsJobReport.query.order_by(EarningsJobReport.started_at.desc()).limit(30).all()
+    for report in reports:
+        report.phase_durations = json.loads(report.phases) if report.phases else {}
+    
+    completed = [report for report in reports if report.status == 'completed']
+    max_duration = max([report.duration_seconds for report in reports] or [0])
+    max_throughput = max([report.users_per_second for report in reports] or [0])
+    
+    return render_template('admin_earnings_runs.html',
+                         reports=reports,
+                         completed_count=len(completed),
+                         failed_count=len(reports) - len(completed),
+                         max_duration=max_duration,
+                         max_throughput=max_throughput)
+
+@app.route('/admin/cache-stats')
+@login_required
+def admin_cache_stats():
+    if current_user.username != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    return jsonify({'user_identity': user_identity_cache.stats()})
+
+@app.route('/admin/referral-codes')
+@login_required
+def admin_referral_codes():
+    if current_user.username != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    return jsonify(referral_code_usage())
 
 @app.route('/admin/process-earnings', methods=['POST'])
 @login_required
@@ -565,8 +1428,8 @@ def admin_process_earnings():
         return jsonify({'error': 'Access denied'}), 403
     
     try:
-        process_daily_earnings()
-        return jsonify({'message': 'Daily earnings processed successfully!'})
+        runs = process_daily_earnings()
+        return jsonify({'message': 'Daily earnings processed successfully!', 'runs': runs})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -590,15 +1453,15 @@ def wallet():
         flash("Database needs to be updated. Please restart the application to update the schema.")
         withdrawals = []
     
-    # Calculate today's earnings
-    today = datetime.utcnow().date()
-    today_earnings = DailyEarning.query.filter_by(user_id=current_user.id, date=today).all()
-    today_total = sum([earning.amount for earning in today_earnings])
+    # Today's earnings, as of the last earnings run
+    summary = get_user_summary(current_user.id)
+    today_total = summary.today_earnings if summary.earnings_date == datetime.utcnow().date() else 0
     
     return render_template('wallet.html', 
                          wallet=wallet, 
                          withdrawals=withdrawals, 
                          today_earnings=today_total, 
+                         summary=summary,
                          user=current_user)
 
 @app.route('/withdraw', methods=['GET', 'POST'])
@@ -646,6 +1509,8 @@ def withdraw():
             wallet.balance -= amount
             
             db.session.add(withdrawal)
+            bump_platform_stats(pending_withdrawals=1, total_wallet_balance=-amount)
+            refresh_user_summaries([current_user.id])
             db.session.commit()
         except Exception as e:
             print(f"Database schema mismatch in withdraw: {e}")
@@ -677,24 +1542,70 @@ def send_chat_message():
     )
     
     db.session.add(chat_message)
+    record_chat_message(chat_message)
     db.session.commit()
+    publish_chat_message(chat_message)
     
-    return jsonify({'success': True})
+    return jsonify({'success': True, 'id': chat_message.id})
 
 @app.route('/chat/messages')
 @login_required
 def get_chat_messages():
-    messages = ChatMessage.query.filter_by(user_id=current_user.id).order_by(ChatMessage.created_at.asc()).all()
+    after_id = request.args.get('after_id', 0, type=int)
     
-    message_data = []
-    for msg in messages:
-        message_data.append({
-            'message': msg.message,
-            'is_admin_reply': msg.is_admin_reply,
-            'created_at': msg.created_at.isoformat()
-        })
+    def build_payload():
+        messages = ChatMessage.query.filter(
+            ChatMessage.user_id == current_user.id,
+            ChatMessage.id > after_id
+        ).order_by(ChatMessage.id).all()
+        
+        message_data = []
+        for msg in messages:
+            message_data.append({
+                'id': msg.id,
+                'message': msg.message,
+                'is_admin_reply': msg.is_admin_reply,
+                'created_at': msg.created_at.isoformat()
+            })
+        
+        return {'messages': message_data}
     
-    return jsonify({'messages': message_data})
+    return conditional_json(chat_conversation_etag(current_user.id, after_id), build_payload)
+
+@app.route('/chat/archive')
+@login_required
+def get_chat_archive():
+    before = parse_date_arg(request.args, 'before')
+    return jsonify(chat_archive_page(current_user.id, before.date() if before else None))
+
+def stream_last_id():
+    """Message id a chat stream starts after: the browser's Last-Event-ID on reconnect, else ?after_id"""
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None:
+        last_id = request.args.get('after_id', type=int)
+    if last_id is None:
+        last_id = db.session.query(db.func.coalesce(db.func.max(ChatMessage.id), 0)).scalar()
+    return last_id
+
+def event_stream_response(stream):
+    return Response(stream_with_context(stream), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # let proxies pass events through unbuffered
+    })
+
+@app.route('/chat/stream')
+@login_required
+def chat_stream():
+    user_id = current_user.id
+    
+    def new_messages(last_id):
+        messages = ChatMessage.query.filter(
+            ChatMessage.user_id == user_id,
+            ChatMessage.id > last_id
+        ).order_by(ChatMessage.id).limit(CHAT_STREAM_BATCH_SIZE).all()
+        return [chat_message_payload(message) for message in messages]
+    
+    return event_stream_response(chat_event_stream(user_chat_channel(user_id), new_messages, stream_last_id()))
 
 @app.route('/admin/chat')
 @login_required
@@ -712,8 +1623,7 @@ def admin_chat():
         selected_user = User.query.get(user_id_filter)
         if selected_user:
             # Create a chat message if none exists to ensure user appears in chat list
-            existing_message = ChatMessage.query.filter_by(user_id=selected_user.id).first()
-            if not existing_message:
+            if db.session.get(Conversation, selected_user.id) is None:
                 # Create an initial system message
                 initial_message = ChatMessage(
                     user_id=selected_user.id,
@@ -722,17 +1632,38 @@ def admin_chat():
                     is_read=True
                 )
                 db.session.add(initial_message)
+                record_chat_message(initial_message)
                 db.session.commit()
+                publish_chat_message(initial_message)
     
-    # Get all users who have sent messages or have been contacted by admin
-    users_with_messages = db.session.query(User).join(ChatMessage).filter(ChatMessage.user_id == User.id).distinct().all()
+    # Conversations with their latest message, one page at a time
+    page_size = min(max(request.args.get('limit', app.config['ADMIN_CHAT_PAGE_SIZE'], type=int), 1), 200)
+    cursor = decode_cursor(request.args.get('after'))
+    conversations, next_cursor = admin_conversations_page(cursor, page_size)
+    conversation_count, unread_total = db.session.execute(select(
+        db.func.count(Conversation.user_id), db.func.coalesce(db.func.sum(Conversation.unread_count), 0)
+    )).one()
     
-    # Get unread message count for each user
-    for user in users_with_messages:
-        user.unread_count = ChatMessage.query.filter_by(user_id=user.id, is_read=False, is_admin_reply=False).count()
-        user.last_message = ChatMessage.query.filter_by(user_id=user.id).order_by(ChatMessage.created_at.desc()).first()
+    last_message_id = db.session.query(db.func.coalesce(db.func.max(ChatMessage.id), 0)).scalar()
     
-    return render_template('admin_chat.html', users=users_with_messages, selected_user=selected_user)
+    return render_template('admin_chat.html', conversations=conversations, selected_user=selected_user,
+                         page_size=page_size, next_cursor=next_cursor, is_first_page=cursor is None,
+                         conversation_count=conversation_count, unread_total=unread_total,
+                         last_message_id=last_message_id)
+
+@app.route('/admin/chat/stream')
+@login_required
+def admin_chat_stream():
+    if current_user.username != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    def new_messages(last_id):
+        rows = db.session.query(ChatMessage, User.username).join(User, User.id == ChatMessage.user_id).filter(
+            ChatMessage.id > last_id
+        ).order_by(ChatMessage.id).limit(CHAT_STREAM_BATCH_SIZE).all()
+        return [chat_message_payload(message, username) for message, username in rows]
+    
+    return event_stream_response(chat_event_stream(ADMIN_CHAT_CHANNEL, new_messages, stream_last_id()))
 
 @app.route('/admin/chat/<int:user_id>')
 @login_required
@@ -741,23 +1672,47 @@ def admin_chat_user(user_id):
         return jsonify({'error': 'Access denied'}), 403
     
     user = User.query.get_or_404(user_id)
-    messages = ChatMessage.query.filter_by(user_id=user_id).order_by(ChatMessage.created_at.asc()).all()
+    after_id = request.args.get('after_id', 0, type=int)
     
-    # Mark user messages as read
-    ChatMessage.query.filter_by(user_id=user_id, is_read=False, is_admin_reply=False).update({'is_read': True})
-    db.session.commit()
+    def build_payload():
+        messages = ChatMessage.query.filter(
+            ChatMessage.user_id == user_id,
+            ChatMessage.id > after_id
+        ).order_by(ChatMessage.id).all()
+        
+        # Mark user messages as read, taking exactly those off the conversation's unread count
+        marked = ChatMessage.query.filter_by(user_id=user_id, is_read=False, is_admin_reply=False).update({'is_read': True})
+        if marked:
+            db.session.execute(
+                update(Conversation).where(Conversation.user_id == user_id).values(
+                    unread_count=Conversation.unread_count - marked
+                ).execution_options(synchronize_session=False)
+            )
+        db.session.commit()
+        
+        message_data = []
+        for msg in messages:
+            message_data.append({
+                'id': msg.id,
+                'message': msg.message,
+                'is_admin_reply': msg.is_admin_reply,
+                'created_at': msg.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+                'is_read': msg.is_read
+            })
+        
+        return {'user': user.username, 'messages': message_data}
     
-    message_data = []
-    for msg in messages:
-        message_data.append({
-            'id': msg.id,
-            'message': msg.message,
-            'is_admin_reply': msg.is_admin_reply,
-            'created_at': msg.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            'is_read': msg.is_read
-        })
+    # Unchanged conversations were already marked as read by the response the client holds
+    return conditional_json(chat_conversation_etag(user_id, after_id), build_payload)
+
+@app.route('/admin/chat/<int:user_id>/archive')
+@login_required
+def admin_chat_archive(user_id):
+    if current_user.username != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
     
-    return jsonify({'user': user.username, 'messages': message_data})
+    before = parse_date_arg(request.args, 'before')
+    return jsonify(chat_archive_page(user_id, before.date() if before else None))
 
 @app.route('/admin/chat/reply', methods=['POST'])
 @login_required
@@ -784,9 +1739,11 @@ def admin_chat_reply():
     )
     
     db.session.add(chat_message)
+    record_chat_message(chat_message)
     db.session.commit()
+    publish_chat_message(chat_message)
     
-    return jsonify({'success': True})
+    return jsonify({'success': True, 'id': chat_message.id})
 
 @app.route('/admin/payments')
 @login_required
@@ -795,69 +1752,49 @@ def admin_payments():
         flash('Access denied. Admin privileges required.')
         return redirect(url_for('dashboard'))
     
+    filters = parse_payment_filters(request.args)
+    page_size = min(max(request.args.get('limit', app.config['ADMIN_PAYMENTS_PAGE_SIZE'], type=int), 1), 200)
+    cursor = decode_cursor(request.args.get('after'))
+    investments_cursor = decode_cursor(request.args.get('investments_after'))
+    
     try:
-        # Check if filtering by specific user
-        user_id_filter = request.args.get('user_id')
-        selected_user = None
+        selected_user = db.session.get(User, filters['user_id']) if filters['user_id'] else None
         
         # Get payment config
-        config = PaymentConfig.query.first()
-        if not config:
-            config = PaymentConfig()
-            db.session.add(config)
-            db.session.commit()
+        config = get_payment_config()
         
-        # Get withdrawal requests - filter by user if specified
-        withdrawals = []
-        try:
-            withdrawals_query = db.session.query(Withdrawal, User).join(User)
-            if user_id_filter:
-                selected_user = User.query.get(user_id_filter)
-                withdrawals_query = withdrawals_query.filter(User.id == user_id_filter)
-            withdrawals_raw = withdrawals_query.order_by(Withdrawal.requested_at.desc()).all()
-            
-            # Filter out any None results and ensure bank_details has a safe value
-            withdrawals = []
-            for withdrawal, user in withdrawals_raw:
-                if withdrawal is not None and user is not None:
-                    # Ensure bank_details is not None to prevent subscriptable errors
-                    if withdrawal.bank_details is None:
-                        withdrawal.bank_details = "Not provided"
-                    withdrawals.append((withdrawal, user))
-                    
-        except Exception as e:
-            print(f"Database schema mismatch in admin payments: {e}")
-            flash("Database schema error. Please restart the application to update the schema.")
-            withdrawals = []
-        
-        # Get pending investments awaiting confirmation - filter by user if specified
-        pending_investments = []
-        try:
-            pending_investments_query = db.session.query(PendingInvestment, User).join(User).filter(
-                PendingInvestment.status == 'awaiting_confirmation'
-            )
-            if user_id_filter:
-                pending_investments_query = pending_investments_query.filter(User.id == user_id_filter)
-            pending_investments_raw = pending_investments_query.order_by(PendingInvestment.confirmed_at.desc()).all()
-            
-            # Filter out any None results
-            pending_investments = [(inv, user) for inv, user in pending_investments_raw 
-                                 if inv is not None and user is not None]
-        except Exception as e:
-            print(f"Database error loading pending investments: {e}")
-            pending_investments = []
+        withdrawals, next_cursor = admin_withdrawals_page(filters, cursor, page_size)
+        pending_investments, next_investments_cursor = admin_pending_investments_page(
+            filters, investments_cursor, page_size
+        )
+        counts = payment_status_counts(filters['user_id'])
         
         return render_template('admin_payments.html', 
                              withdrawals=withdrawals, 
                              pending_investments=pending_investments, 
                              config=config,
-                             selected_user=selected_user)
+                             selected_user=selected_user,
+                             filters=filters,
+                             page_size=page_size,
+                             next_cursor=next_cursor,
+                             next_investments_cursor=next_investments_cursor,
+                             is_first_page=cursor is None and investments_cursor is None,
+                             withdrawal_counts=counts['withdrawals'],
+                             investment_counts=counts['investments'])
                              
     except Exception as e:
         print(f"Database error in admin payments route: {e}")
         flash("Database error occurred. Please try again or restart the application.")
         return redirect(url_for('admin_panel'))
 
+@app.route('/admin/payments/counts')
+@login_required
+def admin_payment_counts():
+    if current_user.username != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    return jsonify(payment_status_counts(request.args.get('user_id', type=int)))
+
 @app.route('/admin/investments/approve/<int:investment_id>', methods=['POST'])
 @login_required
 def admin_approve_investment(investment_id):
@@ -877,17 +1814,20 @@ def admin_approve_investment(investment_id):
             daily_return=pending_investment.daily_return
         )
         
-        # Update user's total investment
-        user = User.query.get(pending_investment.user_id)
+        # Update user's total investment, on a fresh row rather than a cached copy of current_user
+        user = db.session.get(User, pending_investment.user_id, populate_existing=True)
         if not user:
             return jsonify({'success': False, 'error': 'User not found'})
             
         user.total_investment += pending_investment.amount
+        adjust_accrual_rates(user.id, investment.amount)
+        bump_platform_stats(total_investments=investment.amount)
         
         # Update pending investment status
         pending_investment.status = 'confirmed'
         
         db.session.add(investment)
+        refresh_user_summaries([user.id] + referrer_ids(user.id))
         db.session.commit()
         
         return jsonify({'success': True, 'message': 'Investment approved and activated!'})
@@ -928,64 +1868,26 @@ def admin_users():
         flash('Access denied. Admin privileges required.')
         return redirect(url_for('dashboard'))
     
+    sort = request.args.get('sort', 'joined')
+    if sort not in ADMIN_USER_SORTS:
+        sort = 'joined'
+    page_size = min(max(request.args.get('limit', app.config['ADMIN_USERS_PAGE_SIZE'], type=int), 1), 200)
+    cursor = decode_cursor(request.args.get('after'))
+    
     try:
-        # Get all users with their statistics
-        users = User.query.order_by(User.created_at.desc()).all()
-        
-        for user in users:
-            try:
-                # Calculate user statistics
-                user.total_investments_count = Investment.query.filter_by(user_id=user.id, is_active=True).count()
-                user.current_daily_earning = sum([calculate_daily_return(inv.amount) for inv in user.investments if inv.is_active])
-                user.referral_count = Referral.query.filter_by(referrer_id=user.id).count()
-                
-                # Get wallet with error handling
-                try:
-                    user.wallet = Wallet.query.filter_by(user_id=user.id).first()
-                    if not user.wallet:
-                        # Create a temporary wallet object for display (don't save to DB)
-                        class TempWallet:
-                            def __init__(self):
-                                self.balance = 0
-                                self.total_earned = 0
-                                self.total_withdrawn = 0
-                        user.wallet = TempWallet()
-                except Exception as wallet_error:
-                    print(f"Wallet query error for user {user.id}: {wallet_error}")
-                    # Create a temporary wallet object for display
-                    class TempWallet:
-                        def __init__(self):
-                            self.balance = 0
-                            self.total_earned = 0
-                            self.total_withdrawn = 0
-                    user.wallet = TempWallet()
-                
-                # Try to get withdrawal count (might fail due to schema mismatch)
-                try:
-                    user.withdrawal_count = Withdrawal.query.filter_by(user_id=user.id).count()
-                    user.pending_withdrawals = Withdrawal.query.filter_by(user_id=user.id, status='pending').count()
-                except Exception as withdrawal_error:
-                    print(f"Withdrawal query error for user {user.id}: {withdrawal_error}")
-                    user.withdrawal_count = 0
-                    user.pending_withdrawals = 0
-                    
-            except Exception as user_stats_error:
-                print(f"Error calculating stats for user {user.id}: {user_stats_error}")
-                # Set safe defaults
-                user.total_investments_count = 0
-                user.current_daily_earning = 0
-                user.referral_count = 0
-                # Create a temporary wallet object for display
-                class TempWallet:
-                    def __init__(self):
-                        self.balance = 0
-                        self.total_earned = 0
-                        self.total_withdrawn = 0
-                user.wallet = TempWallet()
-                user.withdrawal_count = 0
-                user.pending_withdrawals = 0
-        
-        return render_template('admin_users.html', users=users)
+        users, next_cursor = admin_users_page(sort, cursor, page_size)
+        stats = get_platform_stats()
+        
+        return render_template('admin_users.html',
+                             users=users,
+                             sort=sort,
+                             page_size=page_size,
+                             next_cursor=next_cursor,
+                             is_first_page=cursor is None,
+                             total_users=stats.total_users,
+                             active_investors=stats.active_investors,
+                             total_referrers=stats.referrers,
+                             total_wallet_balance=stats.total_wallet_balance)
         
     except Exception as e:
         print(f"Database error in admin users: {e}")
@@ -1007,11 +1909,18 @@ def admin_delete_user(user_id):
         # Delete related records first (foreign key constraints)
         # Delete chat messages
         ChatMessage.query.filter_by(user_id=user_id).delete()
+        Conversation.query.filter_by(user_id=user_id).delete()
+        ChatArchive.query.filter_by(user_id=user_id).delete()
         
-        # Delete daily earnings
+        # Delete daily earnings and their monthly rollups
+        earned_amount = earnings_totals(earnings_history(user_id))['total']
         DailyEarning.query.filter_by(user_id=user_id).delete()
+        DailyEarningRollup.query.filter_by(user_id=user_id).delete()
         
-        # Delete investments
+        # Remove this user's investments from their referrers' daily rates, then delete them
+        for investment in Investment.query.filter_by(user_id=user_id, is_active=True).all():
+            deactivate_investment(investment)
+        investment_amount = db.session.query(db.func.sum(Investment.amount)).filter_by(user_id=user_id).scalar() or 0
         Investment.query.filter_by(user_id=user_id).delete()
         
         # Delete pending investments
@@ -1019,7 +1928,12 @@ def admin_delete_user(user_id):
         
         # Delete withdrawals (with error handling for schema mismatch)
         try:
+            withdrawn_amount, pending_count = db.session.query(
+                db.func.coalesce(db.func.sum(case((Withdrawal.status == 'completed', Withdrawal.amount), else_=0.0)), 0.0),
+                db.func.count(case((Withdrawal.status == 'pending', Withdrawal.id)))
+            ).filter(Withdrawal.user_id == user_id).one()
             Withdrawal.query.filter_by(user_id=user_id).delete()
+            bump_platform_stats(total_withdrawals=-withdrawn_amount, pending_withdrawals=-pending_count)
         except Exception as withdrawal_error:
             print(f"Schema error deleting withdrawals for user {user_id}: {withdrawal_error}")
             # Continue with user deletion even if withdrawal deletion fails
@@ -1028,16 +1942,27 @@ def admin_delete_user(user_id):
         PaymentConfirmation.query.filter_by(user_id=user_id).delete()
         
         # Delete wallet
+        wallet_balance = db.session.query(db.func.sum(Wallet.balance)).filter_by(user_id=user_id).scalar() or 0
         Wallet.query.filter_by(user_id=user_id).delete()
+        bump_platform_stats(total_wallet_balance=-wallet_balance)
         
         # Delete referrals where this user is the referrer
-        Referral.query.filter_by(referrer_id=user_id).delete()
+        referral_count = Referral.query.filter_by(referrer_id=user_id).delete()
         
-        # Delete referrals where this user was referred
-        Referral.query.filter_by(referred_user_id=user_id).delete()
+        # Delete referrals where this user was referred, then refresh those referrers' summaries
+        referrers = referrer_ids(user_id)
+        referral_count += Referral.query.filter_by(referred_user_id=user_id).delete()
+        refresh_user_summaries(referrers + [user_id])
+        UserSummary.query.filter_by(user_id=user_id).delete()
         
         # Finally delete the user
         db.session.delete(user)
+        bump_platform_stats(
+            total_users=-1,
+            total_investments=-investment_amount,
+            total_referrals=-referral_count,
+            total_earnings_paid=-earned_amount
+        )
         db.session.commit()
         
         return jsonify({'success': True, 'message': f'User {user.username} deleted successfully'})
@@ -1072,6 +1997,7 @@ def admin_update_payment():
             return jsonify({'success': False, 'error': 'Missing required data'})
         
         withdrawal = Withdrawal.query.get_or_404(withdrawal_id)
+        bump_platform_stats(**withdrawal_stats_delta(withdrawal, status))
         
         # Update withdrawal status and payment details
         withdrawal.status = status
@@ -1098,7 +2024,9 @@ def admin_update_payment():
             wallet = Wallet.query.filter_by(user_id=withdrawal.user_id).first()
             if wallet:
                 wallet.balance += withdrawal.amount
+                bump_platform_stats(total_wallet_balance=withdrawal.amount)
         
+        refresh_user_summaries([withdrawal.user_id])
         db.session.commit()
         
         return jsonify({'success': True, 'message': f'Payment status updated to {status}'})
@@ -1115,15 +2043,13 @@ def admin_payment_settings():
         flash('Access denied. Admin privileges required.')
         return redirect(url_for('dashboard'))
     
-    # Get or create payment config
-    config = PaymentConfig.query.first()
-    if not config:
-        config = PaymentConfig()
-        db.session.add(config)
-        db.session.commit()
-    
     if request.method == 'POST':
         # Update payment settings
+        config = PaymentConfig.query.order_by(PaymentConfig.id).first()
+        if not config:
+            config = PaymentConfig()
+            db.session.add(config)
+            db.session.flush()
         config.admin_name = request.form.get('admin_name', config.admin_name)
         config.upi_id = request.form.get('upi_id', config.upi_id)
         
@@ -1140,11 +2066,12 @@ def admin_payment_settings():
         
         config.updated_at = datetime.utcnow()
         db.session.commit()
+        payment_config_cache.invalidate()
         
         flash('Payment settings updated successfully!')
         return redirect(url_for('admin_payment_settings'))
     
-    return render_template('admin_payment_settings.html', config=config)
+    return render_template('admin_payment_settings.html', config=get_payment_config())
 
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
@@ -1167,11 +2094,7 @@ def confirm_investment_payment(investment_id):
         return redirect(url_for('invest'))
     
     # Get payment config
-    config = PaymentConfig.query.first()
-    if not config:
-        config = PaymentConfig()
-        db.session.add(config)
-        db.session.commit()
+    config = get_payment_config()
     
     if request.method == 'POST':
         payment_method = request.form.get('payment_method')
@@ -1213,11 +2136,7 @@ def confirm_payment(withdrawal_id):
         return redirect(url_for('wallet'))
     
     # Get payment config
-    config = PaymentConfig.query.first()
-    if not config:
-        config = PaymentConfig()
-        db.session.add(config)
-        db.session.commit()
+    config = get_payment_config()
     
     if request.method == 'POST':
         payment_method = request.form.get('payment_method')
@@ -1241,6 +2160,7 @@ def confirm_payment(withdrawal_id):
         )
         
         # Update withdrawal status
+        bump_platform_stats(**withdrawal_stats_delta(withdrawal, 'awaiting_confirmation'))
         withdrawal.status = 'awaiting_confirmation'
         
         db.session.add(confirmation)
@@ -1251,90 +2171,1349 @@ def confirm_payment(withdrawal_id):
     
     return render_template('confirm_payment.html', withdrawal=withdrawal, config=config)
 
-def process_daily_earnings():
-    """Process daily earnings for all users"""
-    with app.app_context():
-        today = datetime.utcnow().date()
-        
-        # Check if today's earnings have already been processed
-        if DailyEarning.query.filter_by(date=today).first():
-            return
+class RunRecorder:
+    """Phase durations, rows touched and SQL statement count of one earnings job"""
+    current = threading.local()
+
+    def __init__(self):
+        self.started_at = datetime.utcnow()
+        self.started_clock = time.perf_counter()
+        self.status = 'completed'
+        self.error = None
+        self.phases = {}
+        self.users_processed = 0
+        self.rows_touched = 0
+        self.sql_statements = 0
+
+    @contextmanager
+    def recording(self):
+        """Credit SQL statements issued by this thread to this recorder"""
+        RunRecorder.current.recorder = self
+        try:
+            yield self
+        finally:
+            RunRecorder.current.recorder = None
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + time.perf_counter() - started
+
+    def execute(self, executor, statement):
+        """Execute a write statement and count the rows it touched"""
+        result = executor.execute(statement)
+        if result.rowcount and result.rowcount > 0:
+            self.rows_touched += result.rowcount
+        return result
+
+    def stats(self):
+        return {
+            'phases': self.phases,
+            'users_processed': self.users_processed,
+            'rows_touched': self.rows_touched,
+            'sql_statements': self.sql_statements
+        }
+
+    def merge(self, stats):
+        """Add the statistics returned by a shard worker"""
+        for name, seconds in stats['phases'].items():
+            self.phases[name] = self.phases.get(name, 0) + seconds
+        self.users_processed += stats['users_processed']
+        self.rows_touched += stats['rows_touched']
+        self.sql_statements += stats['sql_statements']
+
+def count_sql_statement(conn, cursor, statement, parameters, context, executemany):
+    """Engine listener crediting each SQL statement to the recorder active on this thread"""
+    recorder = getattr(RunRecorder.current, 'recorder', None)
+    if recorder is not None:
+        recorder.sql_statements += 1
+
+def save_earnings_report(recorder, summaries):
+    """Persist a finished earnings job as an EarningsJobReport"""
+    duration = time.perf_counter() - recorder.started_clock
+    db.session.add(EarningsJobReport(
+        started_at=recorder.started_at,
+        finished_at=datetime.utcnow(),
+        status=recorder.status,
+        run_dates=','.join(summary['run_date'] for summary in summaries),
+        duration_seconds=duration,
+        users_processed=recorder.users_processed,
+        users_per_second=recorder.users_processed / duration if duration else 0,
+        rows_touched=recorder.rows_touched,
+        sql_statements=recorder.sql_statements,
+        phases=json.dumps({name: round(seconds, 4) for name, seconds in recorder.phases.items()}),
+        error=recorder.error
+    ))
+    db.session.commit()
+
+def accrue_daily_earnings(executor, days, now, first_user_id, last_user_id, recorder=None):
+    """Credit one or more days of investment and referral earnings to users in an id range.
+
+    Works with set-based statements whose number does not depend on the user
+    count or on the number of days. executor is db.session or a Connection;
+    nothing is committed here. Returns the investment and referral totals of a
+    single day for the range.
+    """
+    recorder = recorder or RunRecorder()
+    no_sync = {'synchronize_session': False}
+    earning_columns = ['user_id', 'amount', 'earning_type', 'date', 'created_at']
+    day_count = len(days)
+    accrual_days = union_all(*[select(literal(day, db.Date).label('date')) for day in days]).subquery()
+    in_range = User.id.between(first_user_id, last_user_id)
+
+    # One 'investment' earning per active investment of an existing user and day
+    investment_rows = select(
+        Investment.user_id,
+        daily_return_expr(Investment.amount),
+        literal('investment'),
+        accrual_days.c.date,
+        literal(now, db.DateTime)
+    ).join(User, User.id == Investment.user_id).join(accrual_days, true()).where(
+        Investment.is_active.is_(True),
+        in_range
+    ).order_by(accrual_days.c.date, Investment.user_id, Investment.id)
+    with recorder.phase('insert_earnings'):
+        recorder.execute(executor, insert(DailyEarning).from_select(earning_columns, investment_rows))
+
+    # One 'referral' earning per referrer with a positive precomputed referral rate and day
+    referral_rows = select(
+        User.id,
+        User.daily_referral_rate,
+        literal('referral'),
+        accrual_days.c.date,
+        literal(now, db.DateTime)
+    ).join(accrual_days, true()).where(
+        in_range,
+        User.daily_referral_rate > ACCRUAL_RATE_EPSILON
+    ).order_by(accrual_days.c.date, User.id)
+    with recorder.phase('insert_earnings'):
+        recorder.execute(executor, insert(DailyEarning).from_select(earning_columns, referral_rows))
+
+    # Every user gets a wallet, as the per-user loop used to create them on demand
+    missing_wallets = select(
+        User.id, literal(0.0), literal(0.0), literal(0.0), literal(now, db.DateTime)
+    ).outerjoin(Wallet, Wallet.user_id == User.id).where(in_range, Wallet.id.is_(None))
+    with recorder.phase('update_wallets'):
+        recorder.execute(executor, insert(Wallet).from_select(
+            ['user_id', 'balance', 'total_earned', 'total_withdrawn', 'last_updated'], missing_wallets
+        ))
+        recorder.execute(executor,
+            update(User).where(in_range).values(
+                total_earnings=User.total_earnings + User.daily_investment_rate * day_count,
+                referral_earnings=User.referral_earnings + User.daily_referral_rate * day_count
+            ).execution_options(**no_sync)
+        )
+
+    # Balances are credited to the user's first wallet, like Wallet.query.filter_by(...).first()
+    first_wallets = select(db.func.min(Wallet.id)).join(
+        User, User.id == Wallet.user_id
+    ).where(in_range).group_by(Wallet.user_id).scalar_subquery()
+    earned = (User.daily_investment_rate + User.daily_referral_rate) * day_count
+    with recorder.phase('update_wallets'):
+        recorder.execute(executor,
+            update(Wallet).where(Wallet.user_id == User.id, Wallet.id.in_(first_wallets)).values(
+                balance=Wallet.balance + earned,
+                total_earned=Wallet.total_earned + earned,
+                last_updated=now
+            ).execution_options(**no_sync)
+        )
+
+    # The range's summaries are recomputed in the chunk's transaction, so no statement writes every user
+    with recorder.phase('refresh_summaries'):
+        recorder.execute(executor,
+            delete(UserSummary).where(
+                UserSummary.user_id.between(first_user_id, last_user_id)
+            ).execution_options(**no_sync)
+        )
+        recorder.execute(executor, insert(UserSummary).from_select(
+            USER_SUMMARY_COLUMNS, user_summary_rows(user_range=(first_user_id, last_user_id))
+        ))
+
+    with recorder.phase('compute'):
+        investment_total, referral_total = executor.execute(
+            select(
+                db.func.coalesce(db.func.sum(User.daily_investment_rate), 0.0),
+                db.func.coalesce(db.func.sum(User.daily_referral_rate), 0.0)
+            ).where(in_range)
+        ).one()
+    return {'investment_total': investment_total, 'referral_total': referral_total}
+
+# Rates below half a paisa are float residue of adding and removing contributions, not earnings
+ACCRUAL_RATE_EPSILON = 0.005
+
+def rounded_rate(rate):
+    """SQL expression of an adjusted rate rounded to 6 decimals, with residue below ACCRUAL_RATE_EPSILON set to 0"""
+    return case(
+        (db.func.abs(rate) < ACCRUAL_RATE_EPSILON, 0.0),
+        else_=db.cast(db.func.round(db.cast(rate, db.Numeric), 6), db.Float)
+    )
+
+def adjust_accrual_rates(user_id, amount, sign=1):
+    """Add (sign=1) or remove (sign=-1) an active investment's contribution to the precomputed daily rates.
+
+    The owner's daily_investment_rate changes by the investment's return and every
+    referrer of the owner gains or loses its referral bonus, once per referral row.
+    The results are rounded, so a contribution added and removed again leaves
+    the rate exactly where it was.
+    """
+    no_sync = {'synchronize_session': False}
+    db.session.execute(
+        update(User).where(User.id == user_id).values(
+            daily_investment_rate=rounded_rate(User.daily_investment_rate + sign * calculate_daily_return(amount))
+        ).execution_options(**no_sync)
+    )
+    bump_platform_stats(daily_payouts=sign * calculate_daily_return(amount))
+
+    bonus = calculate_referral_bonus(amount)
+    if bonus:
+        referrals = select(
+            Referral.referrer_id.label('user_id'),
+            db.func.count(Referral.id).label('referral_count')
+        ).where(Referral.referred_user_id == user_id).group_by(Referral.referrer_id).subquery()
+        db.session.execute(
+            update(User).where(User.id == referrals.c.user_id).values(
+                daily_referral_rate=rounded_rate(User.daily_referral_rate + sign * bonus * referrals.c.referral_count)
+            ).execution_options(**no_sync)
+        )
+
+def deactivate_investment(investment):
+    """Deactivate an investment and withdraw it from the precomputed daily rates"""
+    if investment.is_active:
+        investment.is_active = False
+        adjust_accrual_rates(investment.user_id, investment.amount, sign=-1)
+
+def rebuild_accrual_rates():
+    """Recompute every user's daily accrual rates from scratch.
+
+    The rates are rounded like adjust_accrual_rates() rounds them, so any
+    difference from the stored values is drift. Returns the number of users
+    whose stored rates had drifted before they were overwritten.
+    """
+    no_sync = {'synchronize_session': False}
+    investment_rates = select(
+        Investment.user_id.label('user_id'),
+        db.func.sum(daily_return_expr(Investment.amount)).label('rate')
+    ).where(Investment.is_active.is_(True)).group_by(Investment.user_id).subquery()
+
+    referred_user = aliased(User)
+    referral_rates = select(
+        Referral.referrer_id.label('user_id'),
+        db.func.sum(referral_bonus_expr(Investment.amount)).label('rate')
+    ).join(
+        referred_user, referred_user.id == Referral.referred_user_id
+    ).join(
+        Investment, Investment.user_id == Referral.referred_user_id
+    ).where(Investment.is_active.is_(True)).group_by(Referral.referrer_id).subquery()
+
+    expected_investment = rounded_rate(db.func.coalesce(investment_rates.c.rate, 0.0))
+    expected_referral = rounded_rate(db.func.coalesce(referral_rates.c.rate, 0.0))
+    drifted = db.session.execute(
+        select(db.func.count(User.id)).outerjoin(
+            investment_rates, investment_rates.c.user_id == User.id
+        ).outerjoin(
+            referral_rates, referral_rates.c.user_id == User.id
+        ).where(
+            (db.func.coalesce(User.daily_investment_rate, 0.0) != expected_investment) |
+            (db.func.coalesce(User.daily_referral_rate, 0.0) != expected_referral)
+        )
+    ).scalar()
+
+    db.session.execute(
+        update(User).values(daily_investment_rate=0.0, daily_referral_rate=0.0).execution_options(**no_sync)
+    )
+    db.session.execute(
+        update(User).where(User.id == investment_rates.c.user_id).values(
+            daily_investment_rate=rounded_rate(investment_rates.c.rate)
+        ).execution_options(**no_sync)
+    )
+    db.session.execute(
+        update(User).where(User.id == referral_rates.c.user_id).values(
+            daily_referral_rate=rounded_rate(referral_rates.c.rate)
+        ).execution_options(**no_sync)
+    )
+    db.session.commit()
+    return drifted
+
+USER_SUMMARY_COLUMNS = [
+    'user_id', 'active_investment_count', 'daily_earning', 'referral_count', 'referral_bonus',
+    'earnings_date', 'today_earnings', 'pending_withdrawal_count', 'pending_withdrawal_total', 'wallet_balance',
+    'updated_at'
+]
+
+def user_summary_rows(user_ids=None, user_range=None):
+    """Select user_summary rows computed from the raw tables, for user_ids, an inclusive id range or every user"""
+    today = datetime.utcnow().date()
+
+    def restrict(query, column):
+        if user_ids is not None:
+            return query.where(column.in_(user_ids))
+        if user_range is not None:
+            return query.where(column.between(*user_range))
+        return query
+
+    investments = restrict(select(
+        Investment.user_id.label('user_id'),
+        db.func.count(Investment.id).label('active_investment_count'),
+        db.func.sum(daily_return_expr(Investment.amount)).label('daily_earning')
+    ).where(Investment.is_active.is_(True)), Investment.user_id).group_by(Investment.user_id).subquery()
+
+    # Referrals of deleted users still count, but carry no bonus
+    referred_user = aliased(User)
+    referrals = restrict(select(
+        Referral.referrer_id.label('user_id'),
+        db.func.count(db.distinct(Referral.id)).label('referral_count'),
+        db.func.sum(referral_bonus_expr(Investment.amount)).label('referral_bonus')
+    ).outerjoin(
+        referred_user, referred_user.id == Referral.referred_user_id
+    ).outerjoin(
+        Investment, (Investment.user_id == referred_user.id) & Investment.is_active.is_(True)
+    ), Referral.referrer_id).group_by(Referral.referrer_id).subquery()
+
+    earnings = restrict(select(
+        DailyEarning.user_id.label('user_id'),
+        db.func.sum(DailyEarning.amount).label('today_earnings')
+    ).where(DailyEarning.date == today), DailyEarning.user_id).group_by(DailyEarning.user_id).subquery()
+
+    withdrawals = restrict(select(
+        Withdrawal.user_id.label('user_id'),
+        db.func.count(Withdrawal.id).label('pending_withdrawal_count'),
+        db.func.sum(Withdrawal.amount).label('pending_withdrawal_total')
+    ).where(Withdrawal.status.in_(OPEN_WITHDRAWAL_STATUSES)), Withdrawal.user_id).group_by(Withdrawal.user_id).subquery()
+
+    # Balances are credited to the user's first wallet, so that is the one shown and sorted by
+    wallets = restrict(select(
+        Wallet.user_id.label('user_id'),
+        Wallet.balance.label('wallet_balance')
+    ).where(Wallet.id.in_(select(db.func.min(Wallet.id)).group_by(Wallet.user_id))), Wallet.user_id).subquery()
+
+    return restrict(select(
+        User.id,
+        db.func.coalesce(investments.c.active_investment_count, 0),
+        db.func.coalesce(investments.c.daily_earning, 0.0),
+        db.func.coalesce(referrals.c.referral_count, 0),
+        db.func.coalesce(referrals.c.referral_bonus, 0.0),
+        literal(today, db.Date),
+        db.func.coalesce(earnings.c.today_earnings, 0.0),
+        db.func.coalesce(withdrawals.c.pending_withdrawal_count, 0),
+        db.func.coalesce(withdrawals.c.pending_withdrawal_total, 0.0),
+        db.func.coalesce(wallets.c.wallet_balance, 0.0),
+        literal(datetime.utcnow(), db.DateTime)
+    ).outerjoin(
+        investments, investments.c.user_id == User.id
+    ).outerjoin(
+        referrals, referrals.c.user_id == User.id
+    ).outerjoin(
+        earnings, earnings.c.user_id == User.id
+    ).outerjoin(
+        withdrawals, withdrawals.c.user_id == User.id
+    ).outerjoin(
+        wallets, wallets.c.user_id == User.id
+    ), User.id)
+
+def refresh_user_summaries(user_ids):
+    """Recompute the summaries of some users in the caller's transaction; nothing is committed"""
+    user_ids = sorted({user_id for user_id in user_ids if user_id is not None})
+    if not user_ids:
+        return
+    db.session.flush()
+    # The platform investor and referrer counters follow the summaries' transitions
+    flags = select(
+        db.func.count(case((UserSummary.active_investment_count > 0, 1))),
+        db.func.count(case((UserSummary.referral_count > 0, 1)))
+    ).where(UserSummary.user_id.in_(user_ids))
+    investors_before, referrers_before = db.session.execute(flags).one()
+    db.session.execute(
+        delete(UserSummary).where(UserSummary.user_id.in_(user_ids)).execution_options(synchronize_session=False)
+    )
+    db.session.execute(insert(UserSummary).from_select(USER_SUMMARY_COLUMNS, user_summary_rows(user_ids)))
+    investors_after, referrers_after = db.session.execute(flags).one()
+    bump_platform_stats(
+        active_investors=investors_after - investors_before,
+        referrers=referrers_after - referrers_before
+    )
+
+def rebuild_user_summaries():
+    """Recompute every user's summary in a single transaction.
+
+    This writes every row at once, so it is only used to build the table, by
+    setup.py and at startup; earnings runs refresh the summaries chunk by chunk.
+    """
+    db.session.execute(delete(UserSummary).execution_options(synchronize_session=False))
+    db.session.execute(insert(UserSummary).from_select(USER_SUMMARY_COLUMNS, user_summary_rows()))
+    db.session.commit()
+
+def referrer_ids(user_id):
+    """Ids of the users who referred user_id, once per referral row"""
+    return db.session.execute(
+        select(Referral.referrer_id).where(Referral.referred_user_id == user_id)
+    ).scalars().all()
+
+def get_user_summary(user_id):
+    """Primary-key lookup of a user's summary, building it first if the user has none yet"""
+    summary = db.session.get(UserSummary, user_id)
+    if summary is None:
+        refresh_user_summaries([user_id])
+        db.session.commit()
+        summary = db.session.get(UserSummary, user_id)
+    return summary
+
+def bump_platform_stats(executor=None, **deltas):
+    """Add deltas to the platform counters in the caller's transaction; nothing is committed"""
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    (executor or db.session).execute(
+        update(PlatformStats).where(PlatformStats.id == PLATFORM_STATS_ID).values(
+            **{name: getattr(PlatformStats, name) + delta for name, delta in deltas.items()}
+        ).execution_options(synchronize_session=False)
+    )
+
+def withdrawal_stats_delta(withdrawal, new_status):
+    """Counter deltas for moving a withdrawal from its current status to new_status"""
+    deltas = {}
+    if withdrawal.status != new_status:
+        if withdrawal.status == 'pending':
+            deltas['pending_withdrawals'] = -1
+        elif new_status == 'pending':
+            deltas['pending_withdrawals'] = 1
+        if withdrawal.status == 'completed':
+            deltas['total_withdrawals'] = -withdrawal.amount
+        elif new_status == 'completed':
+            deltas['total_withdrawals'] = withdrawal.amount
+    return deltas
+
+def recompute_platform_stats():
+    """Recompute the platform counters from the raw tables.
+
+    Corrects any drift of the incremental updates. Returns the counters that
+    differed from the stored values, as {name: (stored, recomputed)}.
+    """
+    # Lock the row first, so incremental updates wait and then apply on top of the new values
+    stats = db.session.get(PlatformStats, PLATFORM_STATS_ID, with_for_update=True)
+    if stats is None:
+        try:
+            db.session.add(PlatformStats(id=PLATFORM_STATS_ID))
+            db.session.commit()
+        except IntegrityError:
+            # Another process created the row first
+            db.session.rollback()
+        stats = db.session.get(PlatformStats, PLATFORM_STATS_ID, with_for_update=True)
+
+    _, active_amounts = active_investment_columns()
+    recomputed = {
+        'total_users': db.session.query(db.func.count(User.id)).scalar(),
+        'total_investments': db.session.query(db.func.coalesce(db.func.sum(Investment.amount), 0.0)).scalar(),
+        'daily_payouts': float(calculate_daily_returns(active_amounts).sum()),
+        'total_referrals': db.session.query(db.func.count(Referral.id)).scalar(),
+        'total_withdrawals': db.session.query(db.func.coalesce(db.func.sum(Withdrawal.amount), 0.0)).filter(
+            Withdrawal.status == 'completed'
+        ).scalar(),
+        'pending_withdrawals': db.session.query(db.func.count(Withdrawal.id)).filter(
+            Withdrawal.status == 'pending'
+        ).scalar(),
+        'total_earnings_paid': db.session.query(db.func.coalesce(db.func.sum(DailyEarning.amount), 0.0)).scalar()
+            + db.session.query(db.func.coalesce(db.func.sum(DailyEarningRollup.amount), 0.0)).scalar(),
+        'active_investors': db.session.query(db.func.count(db.distinct(Investment.user_id))).join(
+            User, User.id == Investment.user_id
+        ).filter(Investment.is_active.is_(True)).scalar(),
+        'referrers': db.session.query(db.func.count(db.distinct(Referral.referrer_id))).join(
+            User, User.id == Referral.referrer_id
+        ).scalar(),
+        'total_wallet_balance': db.session.query(db.func.coalesce(db.func.sum(Wallet.balance), 0.0)).scalar()
+    }
+
+    drift = {
+        name: (getattr(stats, name), value) for name, value in recomputed.items()
+        if abs((getattr(stats, name) or 0) - value) > 1e-6
+    }
+    for name, value in recomputed.items():
+        setattr(stats, name, value)
+    stats.recomputed_at = datetime.utcnow()
+    db.session.commit()
+    return drift
+
+def get_platform_stats():
+    """Primary-key read of the platform counters, computing them first if the row is missing"""
+    stats = db.session.get(PlatformStats, PLATFORM_STATS_ID)
+    if stats is None:
+        recompute_platform_stats()
+        stats = db.session.get(PlatformStats, PLATFORM_STATS_ID)
+    return stats
+
+def keyset_page(query, key, cursor, page_size):
+    """One page of query in descending key order and the cursor of the next page, or None.
+
+    key lists the sort columns and must end with a unique one. The key values
+    are selected after the query's own columns and are not part of the
+    returned rows. A cursor that does not match the key is ignored.
+    """
+    bounds = None
+    if cursor is not None and len(cursor) == len(key):
+        bounds = []
+        try:
+            for column, value in zip(key, cursor):
+                if isinstance(column.type, db.DateTime):
+                    value = datetime.fromisoformat(value)
+                elif isinstance(column.type, db.Date):
+                    value = datetime.fromisoformat(value).date()
+                bounds.append(value)
+        except (ValueError, TypeError):
+            bounds = None  # a malformed cursor shows the first page
+    if bounds is not None:
+        query = query.where(tuple_(*key) < tuple_(*bounds))
+    rows = db.session.execute(
+        query.add_columns(*key).order_by(*[column.desc() for column in key]).limit(page_size + 1)
+    ).all()
+    page = [tuple(row[:-len(key)]) for row in rows[:page_size]]
+    next_cursor = encode_cursor(list(rows[page_size - 1][-len(key):])) if len(rows) > page_size else None
+    return page, next_cursor
+
+first_wallet = aliased(Wallet)
+
+# Admin user listing sort keys, each ordered descending and ending with a unique column
+ADMIN_USER_SORTS = {
+    'joined': [User.created_at, User.id],
+    'investment': [User.total_investment, User.created_at, User.id],
+    'balance': [UserSummary.wallet_balance, UserSummary.user_id],
+    'referrals': [UserSummary.referral_count, UserSummary.user_id]
+}
+
+def admin_users_query(sort):
+    """The admin user listing query for a sort and its keyset key.
+
+    Sorts on user_summary columns read that table's index and join the users
+    to it, so they list the users that have a summary row; every user gets one
+    at registration or at startup.
+    """
+    key = ADMIN_USER_SORTS[sort]
+    query = select(User, UserSummary, first_wallet)
+    if key[-1] is UserSummary.user_id:
+        query = query.select_from(UserSummary).join(User, User.id == UserSummary.user_id)
+    else:
+        query = query.outerjoin(UserSummary, UserSummary.user_id == User.id)
+    query = query.outerjoin(
+        first_wallet, first_wallet.id == select(db.func.min(Wallet.id)).where(
+            Wallet.user_id == User.id
+        ).correlate(User).scalar_subquery()
+    )
+    return query, key
+
+def admin_users_page(sort, cursor, page_size):
+    """One keyset page of the admin user listing and the cursor of the next page, or None.
+
+    Users come with their statistics from a single query joining their summary
+    row and first wallet, and every sort key is indexed, so the cost of a page
+    does not depend on the number of users before it.
+    """
+    query, key = admin_users_query(sort)
+    rows, next_cursor = keyset_page(query, key, cursor, page_size)
+
+    users = []
+    for user, summary, wallet in rows:
+        user.total_investments_count = summary.active_investment_count if summary else 0
+        user.current_daily_earning = summary.daily_earning if summary else 0
+        user.referral_count = summary.referral_count if summary else 0
+        # Users without a wallet are shown with an empty one that is not saved
+        user.wallet = wallet or Wallet(balance=0, total_earned=0, total_withdrawn=0)
+        users.append(user)
+    return users, next_cursor
+
+WITHDRAWAL_STATUSES = ('pending', 'awaiting_confirmation', 'processing', 'completed', 'cancelled')
+PENDING_INVESTMENT_STATUSES = ('pending_payment', 'awaiting_confirmation', 'confirmed', 'rejected', 'expired')
+
+def parse_date_arg(args, name):
+    """Midnight of a YYYY-MM-DD query string argument, or None when it is missing or malformed"""
+    try:
+        return datetime.strptime(args.get(name, ''), '%Y-%m-%d')
+    except ValueError:
+        return None
+
+def parse_payment_filters(args):
+    """Admin payments queue filters from the query string; malformed values are ignored"""
+    filters = {
+        'status': args.get('status', 'pending'),
+        'user_id': args.get('user_id', type=int),
+        'min_amount': args.get('min_amount', type=float),
+        'max_amount': args.get('max_amount', type=float),
+        'date_from': parse_date_arg(args, 'date_from'),
+        'date_to': parse_date_arg(args, 'date_to')
+    }
+    if filters['status'] != 'all' and filters['status'] not in WITHDRAWAL_STATUSES:
+        filters['status'] = 'pending'
+    return filters
+
+def payment_criteria(filters, model, date_column):
+    """WHERE criteria of the user, amount and date range filters for Withdrawal or PendingInvestment"""
+    criteria = []
+    if filters['user_id']:
+        criteria.append(model.user_id == filters['user_id'])
+    if filters['min_amount'] is not None:
+        criteria.append(model.amount >= filters['min_amount'])
+    if filters['max_amount'] is not None:
+        criteria.append(model.amount <= filters['max_amount'])
+    if filters['date_from']:
+        criteria.append(date_column >= filters['date_from'])
+    if filters['date_to']:
+        criteria.append(date_column < filters['date_to'] + timedelta(days=1))
+    return criteria
+
+def admin_withdrawals_page(filters, cursor, page_size):
+    """One page of (Withdrawal, User) rows of the admin payments queue, newest request first.
+
+    With a status filter the page is read through the (status, requested_at)
+    index, so the pending queue does not scan the completed history.
+    """
+    query = select(Withdrawal, User).join(User, User.id == Withdrawal.user_id).where(
+        *payment_criteria(filters, Withdrawal, Withdrawal.requested_at)
+    )
+    if filters['status'] != 'all':
+        query = query.where(Withdrawal.status == filters['status'])
+    return keyset_page(query, [Withdrawal.requested_at, Withdrawal.id], cursor, page_size)
+
+def admin_pending_investments_page(filters, cursor, page_size):
+    """One page of (PendingInvestment, User) rows awaiting confirmation, newest submission first"""
+    query = select(PendingInvestment, User).join(User, User.id == PendingInvestment.user_id).where(
+        PendingInvestment.status == 'awaiting_confirmation',
+        *payment_criteria(filters, PendingInvestment, PendingInvestment.confirmed_at)
+    )
+    return keyset_page(query, [PendingInvestment.confirmed_at, PendingInvestment.id], cursor, page_size)
+
+def admin_conversations_page(cursor, page_size):
+    """One page of (Conversation, username, last message) rows of the admin inbox, latest message first"""
+    query = select(Conversation, User.username, ChatMessage.message).join(
+        User, User.id == Conversation.user_id
+    ).join(
+        ChatMessage, ChatMessage.id == Conversation.last_message_id
+    )
+    return keyset_page(query, [Conversation.last_message_id], cursor, page_size)
+
+def earnings_history_criteria(user_id, date_from=None, date_to=None):
+    """WHERE criteria of a user's earnings history between two optional days, both included"""
+    criteria = [DailyEarning.user_id == user_id]
+    if date_from:
+        criteria.append(DailyEarning.date >= date_from.date())
+    if date_to:
+        criteria.append(DailyEarning.date <= date_to.date())
+    return criteria
+
+# Earnings history tiers: raw DailyEarning days and monthly DailyEarningRollup rows
+RAW_EARNINGS_TIER = 0
+MONTHLY_EARNINGS_TIER = 1
+
+EarningsHistoryEntry = namedtuple('EarningsHistoryEntry', ['date', 'tier', 'id', 'amount', 'earning_type', 'row_count'])
+
+def earnings_history(user_id, date_from=None, date_to=None):
+    """A user's raw and rolled-up earnings as one subquery of EarningsHistoryEntry columns.
+
+    Monthly rows are dated by the first day of their month and are included
+    when their month overlaps the date range.
+    """
+    raw = select(
+        DailyEarning.date.label('date'),
+        literal(RAW_EARNINGS_TIER).label('tier'),
+        DailyEarning.id.label('id'),
+        DailyEarning.amount.label('amount'),
+        DailyEarning.earning_type.label('earning_type'),
+        literal(1).label('row_count')
+    ).where(*earnings_history_criteria(user_id, date_from, date_to))
+    monthly = select(
+        DailyEarningRollup.month,
+        literal(MONTHLY_EARNINGS_TIER),
+        DailyEarningRollup.id,
+        DailyEarningRollup.amount,
+        DailyEarningRollup.earning_type,
+        DailyEarningRollup.row_count
+    ).where(DailyEarningRollup.user_id == user_id)
+    if date_from:
+        monthly = monthly.where(DailyEarningRollup.month >= date_from.date().replace(day=1))
+    if date_to:
+        monthly = monthly.where(DailyEarningRollup.month <= date_to.date())
+    return union_all(raw, monthly).subquery()
+
+def earnings_history_page(history, cursor, page_size):
+    """One page of EarningsHistoryEntry rows of an earnings_history() subquery, newest first"""
+    rows, next_cursor = keyset_page(
+        select(history), [history.c.date, history.c.tier, history.c.id], cursor, page_size
+    )
+    return [EarningsHistoryEntry(*row) for row in rows], next_cursor
+
+def earnings_totals(history):
+    """Investment, referral and total earnings of an earnings_history() subquery, summed in SQL"""
+    query = select(
+        db.func.coalesce(db.func.sum(case((history.c.earning_type == 'investment', history.c.amount), else_=0.0)), 0.0),
+        db.func.coalesce(db.func.sum(case((history.c.earning_type == 'referral', history.c.amount), else_=0.0)), 0.0),
+        db.func.coalesce(db.func.sum(history.c.amount), 0.0)
+    )
+    investment, referral, total = db.session.execute(query).one()
+    return {'investment': investment, 'referral': referral, 'total': total}
+
+def earnings_rollup_cutoff(today):
+    """First day whose DailyEarning rows are kept raw; earlier rows are rolled up by month.
+
+    Only whole months are rolled up, and never a day the earnings job may
+    still backfill, since start_earnings_run() checks the raw rows of a day.
+    """
+    retention_days = max(app.config['EARNINGS_RETENTION_DAYS'], app.config['EARNINGS_MAX_BACKFILL_DAYS'])
+    return (today - timedelta(days=retention_days)).replace(day=1)
+
+def rollup_daily_earnings(today=None, batch_size=None):
+    """Compact DailyEarning rows before the retention cutoff into monthly DailyEarningRollup rows.
+
+    Works through the oldest month first in batches of raw rows. Each batch
+    adds its per-user, per-type sums to the monthly rows and deletes the raw
+    rows in one transaction, so an interrupted rollup neither loses nor
+    double counts earnings. Returns the number of raw rows compacted.
+    """
+    today = today or datetime.utcnow().date()
+    batch_size = batch_size or app.config['EARNINGS_ROLLUP_BATCH_SIZE']
+    cutoff = earnings_rollup_cutoff(today)
+    compacted = 0
+    
+    while True:
+        oldest = db.session.query(db.func.min(DailyEarning.date)).filter(DailyEarning.date < cutoff).scalar()
+        if oldest is None:
+            break
+        month = oldest.replace(day=1)
+        month_end = min((month + timedelta(days=32)).replace(day=1), cutoff)
+        now = datetime.utcnow()
+        
+        batch = select(DailyEarning.id).where(
+            DailyEarning.date >= month, DailyEarning.date < month_end
+        ).order_by(DailyEarning.id).limit(batch_size)
+        sums = select(
+            DailyEarning.user_id,
+            DailyEarning.earning_type,
+            db.func.sum(DailyEarning.amount).label('amount'),
+            db.func.count(DailyEarning.id).label('row_count')
+        ).where(DailyEarning.id.in_(batch)).group_by(DailyEarning.user_id, DailyEarning.earning_type).subquery()
         
-        users = User.query.all()
+        try:
+            db.session.execute(
+                update(DailyEarningRollup).where(
+                    DailyEarningRollup.user_id == sums.c.user_id,
+                    DailyEarningRollup.earning_type == sums.c.earning_type,
+                    DailyEarningRollup.month == month
+                ).values(
+                    amount=DailyEarningRollup.amount + sums.c.amount,
+                    row_count=DailyEarningRollup.row_count + sums.c.row_count,
+                    updated_at=now
+                ).execution_options(synchronize_session=False)
+            )
+            new_rollups = select(
+                sums.c.user_id, literal(month, db.Date), sums.c.earning_type, sums.c.amount, sums.c.row_count, literal(now, db.DateTime)
+            ).outerjoin(DailyEarningRollup, (DailyEarningRollup.user_id == sums.c.user_id)
+                        & (DailyEarningRollup.earning_type == sums.c.earning_type)
+                        & (DailyEarningRollup.month == month)).where(DailyEarningRollup.id.is_(None))
+            db.session.execute(insert(DailyEarningRollup).from_select(
+                ['user_id', 'month', 'earning_type', 'amount', 'row_count', 'updated_at'], new_rollups
+            ))
+            compacted += db.session.execute(
+                delete(DailyEarning).where(DailyEarning.id.in_(batch)).execution_options(synchronize_session=False)
+            ).rowcount
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    
+    return compacted
+
+def chat_archive_cutoff(today):
+    """First day whose chat messages stay live; earlier ones are archived by month"""
+    return (today - timedelta(days=app.config['CHAT_RETENTION_DAYS'])).replace(day=1)
+
+def archive_chat_messages(today=None, batch_size=None):
+    """Move chat messages from before the retention cutoff into monthly ChatArchive blobs.
+
+    Works through the oldest messages first, batch_size at a time. Each batch
+    is merged into the compressed blobs of its members' months and deleted in
+    one transaction. A conversation's latest message and member messages the
+    admin has not read yet stay live, so the inbox and its unread counts are
+    unaffected. Returns the number of messages archived.
+    """
+    today = today or datetime.utcnow().date()
+    batch_size = batch_size or app.config['CHAT_ARCHIVE_BATCH_SIZE']
+    cutoff = datetime.combine(chat_archive_cutoff(today), datetime.min.time())
+    archived = 0
+    
+    while True:
+        messages = ChatMessage.query.filter(
+            ChatMessage.created_at < cutoff,
+            ChatMessage.is_read.is_(True) | ChatMessage.is_admin_reply.is_(True),
+            ChatMessage.id.notin_(select(Conversation.last_message_id))
+        ).order_by(ChatMessage.id).limit(batch_size).all()
+        if not messages:
+            break
+        
+        by_month = defaultdict(list)
+        for message in messages:
+            by_month[(message.user_id, message.created_at.date().replace(day=1))].append({
+                'id': message.id,
+                'message': message.message,
+                'is_admin_reply': message.is_admin_reply,
+                'is_read': message.is_read,
+                'created_at': message.created_at.isoformat()
+            })
+        archives = {
+            (archive.user_id, archive.month): archive
+            for archive in ChatArchive.query.filter(tuple_(ChatArchive.user_id, ChatArchive.month).in_(list(by_month)))
+        }
         
-        for user in users:
-            # Calculate investment earnings
-            investments = Investment.query.filter_by(user_id=user.id, is_active=True).all()
-            total_daily_earning = 0
-            
-            for investment in investments:
-                daily_return = calculate_daily_return(investment.amount)
-                total_daily_earning += daily_return
-                
-                # Record daily earning
-                earning = DailyEarning(
-                    user_id=user.id,
-                    amount=daily_return,
-                    earning_type='investment',
-                    date=today
-                )
-                db.session.add(earning)
-            
-            # Calculate referral earnings
-            referrals = Referral.query.filter_by(referrer_id=user.id).all()
-            total_referral_earning = 0
-            
-            for referral in referrals:
-                referred_user = User.query.get(referral.referred_user_id)
-                if referred_user:
-                    referred_investments = Investment.query.filter_by(user_id=referred_user.id, is_active=True).all()
-                    for inv in referred_investments:
-                        bonus = calculate_referral_bonus(inv.amount)
-                        total_referral_earning += bonus
-            
-            if total_referral_earning > 0:
-                referral_earning = DailyEarning(
-                    user_id=user.id,
-                    amount=total_referral_earning,
-                    earning_type='referral',
-                    date=today
+        try:
+            now = datetime.utcnow()
+            for (user_id, month), entries in by_month.items():
+                archive = archives.get((user_id, month))
+                if archive is None:
+                    archive = ChatArchive(user_id=user_id, month=month)
+                    db.session.add(archive)
+                else:
+                    entries = json.loads(zlib.decompress(archive.payload)) + entries
+                    entries.sort(key=lambda entry: entry['id'])
+                archive.payload = zlib.compress(json.dumps(entries).encode())
+                archive.message_count = len(entries)
+                archive.first_message_id = entries[0]['id']
+                archive.last_message_id = entries[-1]['id']
+                archive.updated_at = now
+            archived += db.session.execute(
+                delete(ChatMessage).where(
+                    ChatMessage.id.in_([message.id for message in messages])
+                ).execution_options(synchronize_session=False)
+            ).rowcount
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        db.session.expunge_all()
+    
+    return archived
+
+def chat_archive_page(user_id, before=None):
+    """The messages of a member's latest archived month earlier than before, oldest first.
+
+    Only that month's blob is read and decompressed. Returns a dict with the
+    month, its messages and the cursor of the next older month, or None.
+    """
+    query = select(ChatArchive.month).where(ChatArchive.user_id == user_id)
+    if before is not None:
+        query = query.where(ChatArchive.month < before)
+    months = db.session.execute(query.order_by(ChatArchive.month.desc()).limit(2)).scalars().all()
+    if not months:
+        return {'month': None, 'messages': [], 'before': None}
+    archive = ChatArchive.query.filter_by(user_id=user_id, month=months[0]).one()
+    return {
+        'month': archive.month.strftime('%Y-%m'),
+        'messages': json.loads(zlib.decompress(archive.payload)),
+        'before': archive.month.isoformat() if len(months) > 1 else None
+    }
+
+def payment_status_counts(user_id=None):
+    """Number and total amount of withdrawals and pending investments per status.
+
+    Each table is read with one GROUP BY over its status index instead of
+    loading its rows.
+    """
+    counts = {}
+    for name, model, statuses in (('withdrawals', Withdrawal, WITHDRAWAL_STATUSES),
+                                  ('investments', PendingInvestment, PENDING_INVESTMENT_STATUSES)):
+        query = select(
+            model.status, db.func.count(model.id), db.func.coalesce(db.func.sum(model.amount), 0.0)
+        ).group_by(model.status)
+        if user_id:
+            query = query.where(model.user_id == user_id)
+        counts[name] = {status: {'count': 0, 'amount': 0.0} for status in statuses}
+        for status, count, amount in db.session.execute(query):
+            counts[name][status] = {'count': count, 'amount': round(amount, 2)}
+    return counts
+
+def upgrade_schema():
+    """Add columns and indexes that were introduced after a table was first created.
+
+    db.create_all() only creates missing tables, so existing databases are
+    brought up to date here. Returns the added columns and indexes as
+    'table.name'.
+    """
+    inspector = inspect(db.engine)
+    added = []
+    with db.engine.begin() as connection:
+        preparer = connection.dialect.identifier_preparer
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = 'ALTER TABLE {} ADD COLUMN {} {}'.format(
+                    preparer.format_table(table),
+                    preparer.format_column(column),
+                    column.type.compile(dialect=connection.dialect)
                 )
-                db.session.add(referral_earning)
-            
-            # Update user's total earnings
-            user.total_earnings += total_daily_earning
-            user.referral_earnings += total_referral_earning
-            
-            # Update wallet balance
-            wallet = Wallet.query.filter_by(user_id=user.id).first()
-            if not wallet:
-                wallet = Wallet(user_id=user.id)
-                db.session.add(wallet)
+                if column.default is not None and column.default.is_scalar:
+                    default = literal(column.default.arg, column.type).compile(
+                        dialect=connection.dialect, compile_kwargs={'literal_binds': True}
+                    )
+                    ddl += f' DEFAULT {default}'
+                connection.execute(text(ddl))
+                added.append(f'{table.name}.{column.name}')
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(connection)
+                    added.append(f'{table.name}.{index.name}')
+    return added
+
+def next_user_chunk(after_user_id, chunk_size):
+    """Return (last_user_id, user_count) of the next chunk of users after after_user_id, or (None, 0)"""
+    chunk = select(User.id).where(User.id > after_user_id).order_by(User.id).limit(chunk_size).subquery()
+    last_user_id, user_count = db.session.execute(
+        select(db.func.max(chunk.c.id), db.func.count(chunk.c.id))
+    ).one()
+    return last_user_id, user_count
+
+def shard_boundaries(after_user_id, shard_size):
+    """Return the last user id of every shard_size-th user after after_user_id, plus the final id"""
+    ranked = select(
+        User.id.label('id'),
+        db.func.row_number().over(order_by=User.id).label('position')
+    ).where(User.id > after_user_id).subquery()
+    last_id = select(db.func.max(User.id)).scalar_subquery()
+    return db.session.execute(
+        select(ranked.c.id).where(
+            (ranked.c.position % shard_size == 0) | (ranked.c.id == last_id)
+        ).order_by(ranked.c.id)
+    ).scalars().all()
+
+def unprocessed_dates(today):
+    """Dates up to today that have not been fully accrued, oldest first.
+
+    Looks back from the last completed run (or the last legacy DailyEarning date)
+    and never further than EARNINGS_MAX_BACKFILL_DAYS.
+    """
+    last_date = db.session.query(db.func.max(EarningsRun.run_date)).filter(
+        EarningsRun.status == 'completed'
+    ).scalar()
+    if last_date is None:
+        last_date = db.session.query(db.func.max(DailyEarning.date)).scalar() or today - timedelta(days=1)
+    
+    first_date = max(last_date + timedelta(days=1), today - timedelta(days=app.config['EARNINGS_MAX_BACKFILL_DAYS'] - 1))
+    dates = [first_date + timedelta(days=offset) for offset in range((today - first_date).days + 1)]
+    
+    # Partially processed runs older than the window are still finished
+    stalled = db.session.query(EarningsRun.run_date).filter(
+        EarningsRun.status == 'running',
+        EarningsRun.run_date < first_date
+    ).all()
+    return sorted({run_date for run_date, in stalled} | set(dates))
+
+def start_earnings_run(run_date, chunk_size):
+    """Return the EarningsRun for run_date, creating it, or None if the date is handled elsewhere"""
+    run = EarningsRun.query.filter_by(run_date=run_date).first()
+    if run is not None:
+        return run
+    
+    # Earnings written before the run ledger existed
+    if DailyEarning.query.filter_by(date=run_date).first():
+        return None
+    
+    run = EarningsRun(run_date=run_date, chunk_size=chunk_size, last_user_id=0, users_processed=0)
+    db.session.add(run)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another process started this run first
+        db.session.rollback()
+        return None
+    return run
+
+def process_daily_earnings(chunk_size=None, workers=None):
+    """Process daily earnings for all users, catching up on any missed days.
+
+    Every unprocessed date since the last completed run gets an EarningsRun row.
+    Runs started together form a batch whose days are accrued in one pass over
+    the users, walked in id-ordered chunks that commit independently. The runs
+    record the last completed chunk, so a run that crashed part way resumes
+    where it stopped instead of being skipped or repeated. With more than one
+    worker the chunks are handed to a process pool first.
+    Every call that accrues something, or fails, is recorded as an
+    EarningsJobReport. Returns a summary of each run completed by this call.
+    """
+    with app.app_context():
+        recorder = RunRecorder()
+        try:
+            with recorder.recording():
+                summaries = accrue_unprocessed_dates(recorder, chunk_size, workers)
+        except Exception as e:
+            db.session.rollback()
+            recorder.status = 'failed'
+            recorder.error = str(e)
+            save_earnings_report(recorder, [])
+            raise
+        
+        if summaries:
+            # Shard workers update users on their own connections, out of sight of the cache
+            # events, so every user is dropped when the report commits
+            written_user_ids(db.session).add(None)
+            save_earnings_report(recorder, summaries)
+        return summaries
+
+def accrue_unprocessed_dates(recorder, chunk_size=None, workers=None):
+    """Start a run for every unprocessed date and accrue the runs batch by batch"""
+    today = datetime.utcnow().date()
+    chunk_size = chunk_size or app.config['EARNINGS_CHUNK_SIZE']
+    workers = workers or app.config['EARNINGS_WORKERS']
+    if not app.config['EARNINGS_PROCESS_POOL']:
+        # Forking a gevent web worker would copy its hub and patched sockets, so
+        # the admin trigger and an embedded scheduler accrue in-process
+        workers = 1
+    
+    with recorder.phase('load'):
+        runs = [start_earnings_run(run_date, chunk_size) for run_date in unprocessed_dates(today)]
+        runs = [run for run in runs if run is not None and run.status != 'completed']
+        
+        # Runs created by this call join a new batch led by the oldest of them
+        new_runs = [run for run in runs if run.batch_run_id is None]
+        if new_runs:
+            for run in new_runs:
+                run.batch_run_id = new_runs[0].id
+            db.session.commit()
+    
+    batches = {}
+    for run in runs:
+        batches.setdefault(run.batch_run_id, []).append(run)
+    
+    completed = []
+    for batch_run_id in sorted(batches):
+        batch = batches[batch_run_id]
+        if process_earnings_batch(batch, workers, recorder):
+            completed.extend(batch)
+    
+    return [{
+        'run_date': run.run_date.isoformat(),
+        'users_processed': run.users_processed,
+        'investment_total': run.investment_total,
+        'referral_total': run.referral_total
+    } for run in completed]
+
+def process_earnings_batch(batch, workers, recorder):
+    """Accrue all days of a batch of runs that share one checkpoint; returns False if another process took over"""
+    lead = min(batch, key=lambda run: run.id)
+    days = [run.run_date for run in batch]
+    
+    if workers > 1:
+        with recorder.phase('parallel_shards'):
+            run_earnings_shards(lead, batch, workers, recorder)
+    
+    while True:
+        checkpoint = lead.last_user_id
+        with recorder.phase('load'):
+            last_user_id, user_count = next_user_chunk(checkpoint, lead.chunk_size)
+        if last_user_id is None:
+            break
+        
+        try:
+            totals = accrue_daily_earnings(db.session, days, datetime.utcnow(), checkpoint + 1, last_user_id, recorder)
+            recorder.users_processed += user_count
             
-            daily_total = total_daily_earning + total_referral_earning
-            wallet.balance += daily_total
-            wallet.total_earned += daily_total
-            wallet.last_updated = datetime.utcnow()
+            # Advance the checkpoint in the same transaction as the chunk's writes;
+            # if another process already moved it, this chunk is theirs.
+            claimed = db.session.execute(
+                update(EarningsRun).where(
+                    EarningsRun.batch_run_id == lead.id,
+                    EarningsRun.status == 'running',
+                    EarningsRun.last_user_id == checkpoint
+                ).values(
+                    last_user_id=last_user_id,
+                    users_processed=EarningsRun.users_processed + user_count,
+                    investment_total=EarningsRun.investment_total + totals['investment_total'],
+                    referral_total=EarningsRun.referral_total + totals['referral_total']
+                ).execution_options(synchronize_session=False)
+            ).rowcount
+            if claimed != len(batch):
+                db.session.rollback()
+                recorder.users_processed -= user_count
+                return False
+            earned = (totals['investment_total'] + totals['referral_total']) * len(days)
+            bump_platform_stats(total_earnings_paid=earned, total_wallet_balance=earned)
+            with recorder.phase('commit'):
+                db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
         
+        db.session.refresh(lead)
+    
+    for run in batch:
+        run.status = 'completed'
+        run.completed_at = datetime.utcnow()
+    with recorder.phase('commit'):
         db.session.commit()
+    return True
 
-# Initialize database and scheduler
-with app.app_context():
-    db.create_all()
+def run_earnings_shards(lead, batch, workers, recorder):
+    """Accrue a batch's remaining users as disjoint id shards in a process pool, then merge the shard totals"""
+    if not EarningsRunShard.query.filter_by(run_id=lead.id).first():
+        # Shard boundaries are persisted so a resumed run retries exactly the same ranges
+        first_user_id = lead.last_user_id + 1
+        for last_user_id in shard_boundaries(lead.last_user_id, lead.chunk_size):
+            db.session.add(EarningsRunShard(
+                run_id=lead.id,
+                first_user_id=first_user_id,
+                last_user_id=last_user_id
+            ))
+            first_user_id = last_user_id + 1
+        db.session.commit()
     
-    # Set up scheduler for daily earnings
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(
-        func=process_daily_earnings,
-        trigger="cron",
-        hour=0,
-        minute=0,
-        id='daily_earnings'
+    days = [run.run_date for run in batch]
+    pending = [
+        (shard.id, days, shard.first_user_id, shard.last_user_id)
+        for shard in EarningsRunShard.query.filter_by(run_id=lead.id, status='pending').all()
+    ]
+    # End our read transaction so it does not hold locks while the workers write
+    db.session.commit()
+    if pending:
+        database_uri = db.engine.url.render_as_string(hide_password=False)
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_earnings_worker,
+                                 initargs=(database_uri,)) as pool:
+            futures = [pool.submit(accrue_earnings_shard, *shard) for shard in pending]
+            for future in as_completed(futures):
+                # Worker phase durations are summed across processes
+                recorder.merge(future.result())
+    
+    shard_last_user_id, users_processed, investment_total, referral_total = db.session.execute(
+        select(
+            db.func.max(EarningsRunShard.last_user_id),
+            db.func.coalesce(db.func.sum(EarningsRunShard.users_processed), 0),
+            db.func.coalesce(db.func.sum(EarningsRunShard.investment_total), 0.0),
+            db.func.coalesce(db.func.sum(EarningsRunShard.referral_total), 0.0)
+        ).where(EarningsRunShard.run_id == lead.id)
+    ).one()
+    if shard_last_user_id is not None and shard_last_user_id > lead.last_user_id:
+        for run in batch:
+            run.last_user_id = shard_last_user_id
+            run.users_processed += users_processed
+            run.investment_total += investment_total
+            run.referral_total += referral_total
+        db.session.commit()
+
+worker_engine = None
+
+def init_earnings_worker(database_uri):
+    """Give each pool process its own engine instead of connections inherited from the parent"""
+    global worker_engine
+    connect_args = {'timeout': 60} if database_uri.startswith('sqlite') else {}
+    worker_engine = create_engine(database_uri, connect_args=connect_args)
+    event.listen(worker_engine, 'before_cursor_execute', count_sql_statement)
+
+def accrue_earnings_shard(shard_id, days, first_user_id, last_user_id):
+    """Accrue one shard and mark it completed in a single transaction on the worker's own connection.
+
+    Returns the worker's recorder statistics for the parent to merge.
+    """
+    recorder = RunRecorder()
+    with recorder.recording(), worker_engine.connect() as connection:
+        with recorder.phase('load'):
+            user_count = connection.execute(
+                select(db.func.count(User.id)).where(User.id.between(first_user_id, last_user_id))
+            ).scalar()
+        totals = accrue_daily_earnings(connection, days, datetime.utcnow(), first_user_id, last_user_id, recorder)
+        claimed = connection.execute(
+            update(EarningsRunShard).where(
+                EarningsRunShard.id == shard_id,
+                EarningsRunShard.status == 'pending'
+            ).values(
+                status='completed',
+                users_processed=user_count,
+                investment_total=totals['investment_total'],
+                referral_total=totals['referral_total'],
+                completed_at=datetime.utcnow()
+            )
+        ).rowcount
+        if claimed:
+            earned = (totals['investment_total'] + totals['referral_total']) * len(days)
+            bump_platform_stats(connection, total_earnings_paid=earned, total_wallet_balance=earned)
+            with recorder.phase('commit'):
+                connection.commit()
+            recorder.users_processed += user_count
+        else:
+            # Another process completed this shard; discard our writes
+            connection.rollback()
+    return recorder.stats()
+
+def acquire_scheduler_lease(holder, lease_seconds):
+    """Take or renew the scheduler lease for holder; returns True while holder is the leader.
+
+    The lease row is claimed atomically, so across every web worker, clock
+    process and maintenance script at most one holder owns it at a time.
+    """
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=lease_seconds)
+    try:
+        renewed = db.session.execute(
+            update(SchedulerLease).where(
+                SchedulerLease.name == SCHEDULER_LEASE_NAME,
+                (SchedulerLease.holder == holder) | (SchedulerLease.expires_at < now)
+            ).values(holder=holder, expires_at=expires_at).execution_options(synchronize_session=False)
+        ).rowcount
+        if not renewed:
+            db.session.add(SchedulerLease(name=SCHEDULER_LEASE_NAME, holder=holder, expires_at=expires_at))
+        db.session.commit()
+        return True
+    except IntegrityError:
+        # The lease exists and is held by someone else
+        db.session.rollback()
+        return False
+
+def release_scheduler_lease(holder):
+    """Give up the scheduler lease so a standby process can take over immediately"""
+    SchedulerLease.query.filter_by(name=SCHEDULER_LEASE_NAME, holder=holder).delete()
+    db.session.commit()
+
+def run_scheduled_earnings():
+    """Scheduled entry point for the daily earnings job; only the lease holder processes earnings"""
+    with app.app_context():
+        if not acquire_scheduler_lease(SCHEDULER_HOLDER, app.config['SCHEDULER_LEASE_SECONDS']):
+            return
+    process_daily_earnings()
+
+def run_scheduled_stats_recompute():
+    """Scheduled entry point correcting drift of the platform counters"""
+    with app.app_context():
+        if not acquire_scheduler_lease(SCHEDULER_HOLDER, app.config['SCHEDULER_LEASE_SECONDS']):
+            return
+        drift = recompute_platform_stats()
+        if drift:
+            print(f"Platform stats drift corrected: {drift}")
+
+def run_scheduled_earnings_rollup():
+    """Scheduled entry point compacting old DailyEarning rows into monthly rollups"""
+    with app.app_context():
+        if not acquire_scheduler_lease(SCHEDULER_HOLDER, app.config['SCHEDULER_LEASE_SECONDS']):
+            return
+        compacted = rollup_daily_earnings()
+        if compacted:
+            print(f"Rolled up {compacted} daily earning rows")
+
+def run_scheduled_chat_archive():
+    """Scheduled entry point moving old chat messages into the monthly archive"""
+    with app.app_context():
+        if not acquire_scheduler_lease(SCHEDULER_HOLDER, app.config['SCHEDULER_LEASE_SECONDS']):
+            return
+        archived = archive_chat_messages()
+        if archived:
+            print(f"Archived {archived} chat messages")
+
+def create_scheduler(scheduler_class=BackgroundScheduler):
+    """Build a scheduler whose jobs live in the database and are coalesced after downtime"""
+    return scheduler_class(
+        jobstores={'default': SQLAlchemyJobStore(engine=db.engine)},
+        job_defaults={
+            'coalesce': True,
+            'max_instances': 1,
+            'misfire_grace_time': app.config['SCHEDULER_MISFIRE_GRACE_SECONDS']
+        },
+        timezone='UTC'
     )
-    scheduler.start()
+
+def schedule_job(scheduler, job_id, func, trigger, **trigger_args):
+    """Add a job to a started scheduler, or update it while keeping its stored next run time.
+
+    Replacing a stored job would recompute its next_run_time from now, so a run
+    missed while no process held the lease would be dropped instead of being
+    coalesced within misfire_grace_time.
+    """
+    existing = scheduler.get_job(job_id)
+    options = {'next_run_time': existing.next_run_time} if existing else {}
+    scheduler.add_job(func=func, trigger=trigger, id=job_id, replace_existing=True, **options, **trigger_args)
+
+def schedule_jobs(scheduler):
+    """Register the app's scheduled jobs on a started, paused scheduler"""
+    # Earnings are dated with utcnow(), so the job fires at midnight UTC
+    schedule_job(scheduler, 'daily_earnings',
+                 'app:run_scheduled_earnings',  # textual reference, also valid when app.py runs as __main__
+                 'cron', hour=0, minute=0)
+    schedule_job(scheduler, 'platform_stats_recompute', 'app:run_scheduled_stats_recompute',
+                 'interval', hours=app.config['PLATFORM_STATS_RECOMPUTE_HOURS'])
+    # Well after midnight, so the rollup does not compete with the earnings run
+    schedule_job(scheduler, 'daily_earnings_rollup', 'app:run_scheduled_earnings_rollup', 'cron', hour=3, minute=0)
+    schedule_job(scheduler, 'chat_archive', 'app:run_scheduled_chat_archive', 'cron', hour=3, minute=30)
+
+def run_scheduler(stop_event=None):
+    """Run scheduled jobs while this process holds the scheduler lease, standing by otherwise.
+
+    Used by the clock process (scheduler.py) and, when EMBEDDED_SCHEDULER is set,
+    by a daemon thread in each web worker. Every process competes for the same
+    lease, so only one of them ever has a running scheduler.
+    """
+    stop_event = stop_event or threading.Event()
+    lease_seconds = app.config['SCHEDULER_LEASE_SECONDS']
+    heartbeat_seconds = max(lease_seconds // 3, 1)
+    scheduler = None
+    try:
+        while not stop_event.is_set():
+            with app.app_context():
+                try:
+                    leader = acquire_scheduler_lease(SCHEDULER_HOLDER, lease_seconds)
+                except Exception as lease_error:
+                    print(f"Scheduler lease error: {lease_error}")
+                    leader = False
+                
+                if leader and scheduler is None:
+                    scheduler = create_scheduler()
+                    # Jobs are registered before any of them can fire, so stored run times are seen first
+                    scheduler.start(paused=True)
+                    schedule_jobs(scheduler)
+                    scheduler.resume()
+                    print(f"Scheduler started by {SCHEDULER_HOLDER}")
+                elif not leader and scheduler is not None:
+                    scheduler.shutdown(wait=False)
+                    scheduler = None
+                    print(f"Scheduler lease lost by {SCHEDULER_HOLDER}")
+            stop_event.wait(heartbeat_seconds)
+    finally:
+        if scheduler is not None:
+            scheduler.shutdown()
+            with app.app_context():
+                release_scheduler_lease(SCHEDULER_HOLDER)
+
+# Initialize database
+with app.app_context():
+    summaries_missing = not inspect(db.engine).has_table(UserSummary.__tablename__)
+    conversations_missing = not inspect(db.engine).has_table(Conversation.__tablename__)
+    db.create_all()
+    event.listen(db.engine, 'before_cursor_execute', count_sql_statement)
+    added_columns = upgrade_schema()
+    if 'user.daily_investment_rate' in added_columns:
+        rebuild_accrual_rates()
+    if summaries_missing or 'user_summary.wallet_balance' in added_columns:
+        rebuild_user_summaries()
+    else:
+        # Users added outside the app, e.g. by the database scripts, get their summary here
+        users_without_summary = db.session.execute(
+            select(User.id).outerjoin(UserSummary, UserSummary.user_id == User.id).where(UserSummary.user_id.is_(None))
+        ).scalars().all()
+        if users_without_summary:
+            refresh_user_summaries(users_without_summary)
+            db.session.commit()
+    if db.session.get(UserCacheStamp, USER_CACHE_STAMP_ID) is None:
+        db.session.add(UserCacheStamp(id=USER_CACHE_STAMP_ID))
+        db.session.commit()
+    if conversations_missing:
+        rebuild_conversations()
+    if db.session.get(PlatformStats, PLATFORM_STATS_ID) is None or any(
+        column.startswith('platform_stats.') for column in added_columns
+    ):
+        recompute_platform_stats()
+
+# Scheduled jobs run in the clock process (see Procfile) unless explicitly embedded
+if os.environ.get('EMBEDDED_SCHEDULER'):
+    threading.Thread(target=run_scheduler, name='scheduler', daemon=True).start()
 
 if __name__ == '__main__':
     # For Railway deployment, use PORT environment variable
     port = int(os.environ.get('PORT', 5000))
     debug = os.environ.get('FLASK_ENV') != 'production'
+    if not os.environ.get('EMBEDDED_SCHEDULER'):
+        threading.Thread(target=run_scheduler, name='scheduler', daemon=True).start()
     app.run(debug=debug, host='0.0.0.0', port=port)
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Benchmark the daily earnings job at different user counts
+
+Seeds a throwaway SQLite database per size with users, a referral tree and
+several investments per user, then times process_daily_earnings(), counts
+the SQL statements it issues and records its peak Python memory.
+
+Usage:
+    python benchmark_earnings.py --sizes 1k,10k --output bench.json
+    python benchmark_earnings.py --sizes 1k,10k --baseline bench.json --threshold 0.25
+
+With --baseline, the run fails (exit code 1) if any size got slower or
+issued more statements than the baseline by more than the threshold.
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+SIZE_SUFFIXES = {'k': 1000, 'm': 1000000}
+INVESTMENT_AMOUNTS = [500, 500, 1000, 1000, 1500, 2000, 2500, 5000, 10000]
+
+def parse_size(text):
+    """Turn '10k' or '1m' into an integer user count"""
+    text = text.strip().lower()
+    if text[-1] in SIZE_SUFFIXES:
+        return int(float(text[:-1]) * SIZE_SUFFIXES[text[-1]])
+    return int(text)
+
+def seed_database(db_path, user_count, seed):
+    """Fill the app's tables with synthetic users, referrals, wallets and investments"""
+    rng = random.Random(seed)
+    created_at = datetime(2024, 1, 1).isoformat(' ')
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    batch_size = 50000
+
+    for start in range(1, user_count + 1, batch_size):
+        user_ids = range(start, min(start + batch_size, user_count + 1))
+        users, referrals, wallets, investments = [], [], [], []
+
+        for user_id in user_ids:
+            users.append((user_id, f'user{user_id}', f'user{user_id}@example.com', 'x',
+                          f'{user_id:07d}', 0, 0, 0, 0, 0, created_at))
+            wallets.append((user_id, 0, 0, 0, created_at))
+
+            # Most users are referred, with a heavy tail of users who refer many others
+            if user_id > 1 and rng.random() < 0.7:
+                referrer_id = max(1, int((user_id - 1) * rng.random() ** 3))
+                referrals.append((referrer_id, user_id, f'{referrer_id:07d}', 0, created_at))
+
+            for _ in range(rng.choice([0, 1, 1, 2, 2, 3, 4])):
+                investments.append((user_id, rng.choice(INVESTMENT_AMOUNTS), 0, created_at, rng.random() < 0.9))
+
+        cursor.executemany(
+            'INSERT INTO user (id, username, email, password_hash, referral_code, total_investment, '
+            'total_earnings, referral_earnings, daily_investment_rate, daily_referral_rate, created_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', users)
+        cursor.executemany(
+            'INSERT INTO referral (referrer_id, referred_user_id, referral_code, bonus_earned, created_at) '
+            'VALUES (?, ?, ?, ?, ?)', referrals)
+        cursor.executemany(
+            'INSERT INTO wallet (user_id, balance, total_earned, total_withdrawn, last_updated) '
+            'VALUES (?, ?, ?, ?, ?)', wallets)
+        cursor.executemany(
+            'INSERT INTO investment (user_id, amount, daily_return, created_at, is_active) '
+            'VALUES (?, ?, ?, ?, ?)', investments)
+        conn.commit()
+
+    conn.close()
+
+def run_single(user_count, seed):
+    """Benchmark one size in this process; the database location comes from DATABASE_URL"""
+    from sqlalchemy import event
+    from app import app, db, process_daily_earnings, rebuild_accrual_rates
+
+    app.config['EARNINGS_PROCESS_POOL'] = True
+    with app.app_context():
+        seed_database(db.engine.url.database, user_count, seed)
+        rebuild_accrual_rates()
+
+        statements = {'count': 0}
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements['count'] += 1
+
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    runs = process_daily_earnings()
+    duration = time.perf_counter() - started
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'users': user_count,
+        'duration_seconds': round(duration, 4),
+        'sql_statements': statements['count'],
+        'peak_memory_bytes': peak_memory,
+        'users_per_second': round(user_count / duration, 1) if duration else None,
+        'runs': runs
+    }
+
+def run_size(user_count, seed):
+    """Benchmark one size in a fresh interpreter so the app binds to its own database"""
+    work_dir = tempfile.mkdtemp(prefix='earnings-bench-')
+    try:
+        env = dict(os.environ)
+        env['DATABASE_URL'] = 'sqlite:///' + os.path.join(work_dir, 'bench.db')
+        env.pop('EMBEDDED_SCHEDULER', None)
+        env['PYTHONPATH'] = APP_DIR + os.pathsep + env.get('PYTHONPATH', '')
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--single', str(user_count), '--seed', str(seed)],
+            cwd=work_dir, env=env, capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            raise RuntimeError(f"Benchmark for {user_count} users failed:\n{completed.stderr}")
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def current_commit():
+    """Return the current git commit, if available"""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=APP_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Timing differences below this many seconds are treated as noise
+DURATION_NOISE_SECONDS = 0.05
+
+def find_regressions(results, baseline, threshold):
+    """Compare results with a baseline report and describe every metric beyond the threshold"""
+    regressions = []
+    for size, result in results.items():
+        previous = baseline.get('results', {}).get(size)
+        if not previous:
+            continue
+        if result['duration_seconds'] - previous['duration_seconds'] < DURATION_NOISE_SECONDS:
+            result = dict(result, duration_seconds=previous['duration_seconds'])
+        for metric in ('duration_seconds', 'sql_statements'):
+            if previous[metric] and result[metric] > previous[metric] * (1 + threshold):
+                regressions.append(
+                    f"{size} users: {metric} {result[metric]} vs baseline {previous[metric]} "
+                    f"(+{(result[metric] / previous[metric] - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the daily earnings job')
+    parser.add_argument('--sizes', default='1k,10k', help='comma separated user counts, e.g. 1k,10k,100k,1m')
+    parser.add_argument('--output', default='benchmark_results.json', help='where to write the JSON report')
+    parser.add_argument('--baseline', help='JSON report of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown, 0.25 = 25%%')
+    parser.add_argument('--seed', type=int, default=42, help='random seed for the synthetic data')
+    parser.add_argument('--single', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_single(args.single, args.seed)))
+        return 0
+
+    results = {}
+    for size in [parse_size(size) for size in args.sizes.split(',')]:
+        print(f"⏱️  Benchmarking {size} users...")
+        result = run_size(size, args.seed)
+        results[str(size)] = result
+        print(f"   {result['duration_seconds']}s, {result['sql_statements']} statements, "
+              f"{result['peak_memory_bytes'] / 1024 / 1024:.1f} MiB peak, {result['users_per_second']} users/s")
+
+    report = {
+        'commit': current_commit(),
+        'created_at': datetime.utcnow().isoformat(),
+        'results': results
+    }
+    with open(args.output, 'w') as report_file:
+        json.dump(report, report_file, indent=2)
+    print(f"📄 Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = find_regressions(results, baseline, args.threshold)
+        if regressions:
+            print("❌ Performance regression detected:")
+            for regression in regressions:
+                print(f"   {regression}")
+            return 1
+        print(f"✅ No regression beyond {args.threshold * 100:.0f}% of the baseline")
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
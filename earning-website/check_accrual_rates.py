@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Check that the precomputed daily accrual rates return to exactly zero
+Seeds a throwaway SQLite database with a referrer and referred users, approves
+their investments through the admin route, deletes the users again in another
+order and runs the daily earnings job. Exits with code 1 if the referrer keeps
+a non-zero rate or is credited a referral earning
+
+Usage:
+    python check_accrual_rates.py
+"""
+
+# Imported before app, which reads DATABASE_URL when it is imported
+from check_database import run_check
+
+from werkzeug.security import generate_password_hash
+
+from app import (app, db, DailyEarning, PendingInvestment, Referral, User, calculate_daily_return,
+                 process_daily_earnings)
+
+# Amounts whose referral bonuses are not exactly representable as floats
+INVESTMENT_AMOUNTS = [2345.67, 3333.33, 7777.77, 1000, 500]
+
+def create_user(username, referrer=None):
+    """Add a user, referred by referrer if given, with password 'check'"""
+    user = User(
+        username=username,
+        email=f'{username}@example.com',
+        password_hash=generate_password_hash('check'),
+        referral_code=f'{User.query.count() + 1:07d}',
+        referred_by=referrer.referral_code if referrer else None
+    )
+    db.session.add(user)
+    db.session.flush()
+    if referrer:
+        db.session.add(Referral(referrer_id=referrer.id, referred_user_id=user.id, referral_code=referrer.referral_code))
+    db.session.commit()
+    return user
+
+def main():
+    """Approve and delete referred users' investments, then inspect the referrer"""
+    failures = []
+    with app.app_context():
+        create_user('admin')
+        referrer_id = create_user('referrer').id
+        referred_ids = []
+        for index, amount in enumerate(INVESTMENT_AMOUNTS):
+            referred = create_user(f'referred{index}', db.session.get(User, referrer_id))
+            db.session.add(PendingInvestment(user_id=referred.id, amount=amount,
+                                             daily_return=calculate_daily_return(amount),
+                                             status='awaiting_confirmation'))
+            db.session.commit()
+            referred_ids.append(referred.id)
+
+    client = app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'check'})
+    with app.app_context():
+        pending_ids = [pending.id for pending in PendingInvestment.query.order_by(PendingInvestment.id)]
+    for pending_id in pending_ids:
+        if not client.post(f'/admin/investments/approve/{pending_id}').get_json().get('success'):
+            failures.append(f"approving pending investment {pending_id} failed")
+    for user_id in [referred_ids[1], referred_ids[4], referred_ids[0], referred_ids[3], referred_ids[2]]:
+        if not client.post(f'/admin/users/delete/{user_id}').get_json().get('success'):
+            failures.append(f"deleting user {user_id} failed")
+
+    with app.app_context():
+        referrer = db.session.get(User, referrer_id)
+        if referrer.daily_referral_rate != 0.0:
+            failures.append(f"referrer kept daily_referral_rate {referrer.daily_referral_rate!r}")
+        process_daily_earnings()
+        credited = DailyEarning.query.filter_by(user_id=referrer_id, earning_type='referral').count()
+        if credited:
+            failures.append(f"earnings run credited the referrer {credited} referral earning(s)")
+
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        return 1
+    print("✅ Accrual rates returned to exactly zero after the approve and delete round trip")
+    return 0
+
+if __name__ == '__main__':
+    run_check(main)
@@ -0,0 +1,22 @@
+"""
+Throwaway SQLite database for the check scripts
+Import this module before app: it points DATABASE_URL at a new temporary
+directory, which run_check() removes once the check has finished
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+WORK_DIR = tempfile.mkdtemp(prefix='earnings-check-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(WORK_DIR, 'check.db')
+os.environ.pop('EMBEDDED_SCHEDULER', None)
+
+def run_check(main):
+    """Run a check's main(), remove the database and exit with its status"""
+    try:
+        status = main()
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+    sys.exit(status)
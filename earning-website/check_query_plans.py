@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Check that the hot queries of the app are answered through an index
+Runs EXPLAIN QUERY PLAN (SQLite) or EXPLAIN (PostgreSQL) on each query and
+exits with code 1 if any of them scans its table or sorts its rows instead
+of reading them in index order
+
+Usage:
+    python check_query_plans.py
+    DATABASE_URL=postgresql://... python check_query_plans.py
+"""
+
+import json
+import sys
+from datetime import datetime
+
+from sqlalchemy import select
+
+from app import (app, db, ADMIN_USER_SORTS, ChatArchive, ChatMessage, Conversation, DailyEarning, DailyEarningRollup,
+                 Investment, PendingInvestment, Referral, User, Wallet, Withdrawal, admin_users_query,
+                 earnings_history_criteria)
+
+def hot_queries():
+    """(name, statement, table, ordered) of every query that must not degrade to a scan.
+
+    ordered marks queries whose ORDER BY has to be served by the index too.
+    """
+    user_id = 1
+    today = datetime.utcnow().date()
+    return [
+        ('active investments of a user',
+         select(Investment).filter_by(user_id=user_id, is_active=True), 'investment', False),
+        ('earnings history page',
+         select(DailyEarning).where(*earnings_history_criteria(user_id)).order_by(
+             DailyEarning.date.desc(), DailyEarning.id.desc()).limit(51), 'daily_earning', True),
+        ('monthly earnings of a user',
+         select(DailyEarningRollup).filter_by(user_id=user_id), 'daily_earning_rollup', False),
+        ('earnings run idempotency check',
+         select(DailyEarning.id).filter_by(date=today).limit(1), 'daily_earning', False),
+        ('wallet of a user',
+         select(Wallet).filter_by(user_id=user_id).limit(1), 'wallet', False),
+        ('withdrawal history of a user',
+         select(Withdrawal).filter_by(user_id=user_id).order_by(Withdrawal.requested_at.desc()), 'withdrawal', True),
+        ('pending withdrawal queue',
+         select(Withdrawal).where(Withdrawal.status == 'pending').order_by(
+             Withdrawal.requested_at.desc(), Withdrawal.id.desc()).limit(51), 'withdrawal', True),
+        ('investments awaiting confirmation',
+         select(PendingInvestment).where(PendingInvestment.status == 'awaiting_confirmation').order_by(
+             PendingInvestment.confirmed_at.desc(), PendingInvestment.id.desc()).limit(51), 'pending_investment', True),
+        ('pending investments of a user',
+         select(PendingInvestment).filter_by(user_id=user_id), 'pending_investment', False),
+        ('chat messages of a user after a cursor',
+         select(ChatMessage).where(ChatMessage.user_id == user_id, ChatMessage.id > 100).order_by(ChatMessage.id),
+         'chat_message', True),
+        ('archived chat months of a user',
+         select(ChatArchive.month).where(ChatArchive.user_id == user_id, ChatArchive.month < today).order_by(
+             ChatArchive.month.desc()).limit(2), 'chat_archive', True),
+        ('admin chat inbox',
+         select(Conversation).order_by(Conversation.last_message_id.desc()).limit(51), 'conversation', True),
+        ('referrals made by a user',
+         select(Referral).filter_by(referrer_id=user_id), 'referral', False),
+        ('referrer of a user',
+         select(Referral.referrer_id).filter_by(referred_user_id=user_id), 'referral', False),
+        ('user by referral code',
+         select(User).filter_by(referral_code='1234567'), 'user', False),
+    ] + [
+        (f'admin users by {sort}', admin_users_statement(sort),
+         'user_summary' if sort in ('balance', 'referrals') else 'user', True)
+        for sort in ADMIN_USER_SORTS
+    ]
+
+def admin_users_statement(sort):
+    """The first page of the admin user listing for a sort, as keyset_page orders it"""
+    query, key = admin_users_query(sort)
+    return query.order_by(*[column.desc() for column in key]).limit(51)
+
+def sqlite_problems(connection, sql, table, ordered):
+    """Plan steps of a SQLite query that scan the table or sort through a temporary b-tree.
+
+    Ordered queries may walk a whole index in sort order, as the LIMIT stops
+    them early; every other query has to SEARCH its table.
+    """
+    plan = [row[-1] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql)]
+    problems = [step for step in plan
+                if step.split(' USING')[0] == f'SCAN {table}' and not (ordered and 'INDEX' in step)]
+    if ordered:
+        problems += [step for step in plan if 'TEMP B-TREE FOR ORDER BY' in step]
+    return problems
+
+def postgresql_problems(connection, sql, table, ordered):
+    """Plan nodes of a PostgreSQL query that scan the table sequentially or sort.
+
+    Sequential scans and sorts are disabled for the check, so that the tiny
+    tables of a development database still show whether an index can be used.
+    """
+    connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+    connection.exec_driver_sql('SET LOCAL enable_sort = off')
+    plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + sql).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    problems = []
+    nodes = [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        nodes.extend(node.get('Plans', []))
+        if node['Node Type'] == 'Seq Scan' and node.get('Relation Name') == table:
+            problems.append(f"Seq Scan on {table}")
+        elif ordered and node['Node Type'] in ('Sort', 'Incremental Sort'):
+            problems.append(f"{node['Node Type']} by {', '.join(node.get('Sort Key', []))}")
+    return problems
+
+def main():
+    """Explain every hot query and report the ones that do not use an index"""
+    with app.app_context():
+        dialect = db.engine.dialect
+        check = postgresql_problems if dialect.name == 'postgresql' else sqlite_problems
+        print(f"Checking query plans on {dialect.name}...")
+
+        failures = 0
+        for name, statement, table, ordered in hot_queries():
+            sql = str(statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+            with db.engine.connect() as connection:
+                with connection.begin():
+                    problems = check(connection, sql, table, ordered)
+            if problems:
+                failures += 1
+                print(f"❌ {name}: {'; '.join(problems)}")
+            else:
+                print(f"✅ {name}")
+
+        if failures:
+            print(f"⚠️  {failures} hot quer{'y' if failures == 1 else 'ies'} degraded to a table scan or sort")
+            return 1
+        print("✅ All hot queries use an index")
+        return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
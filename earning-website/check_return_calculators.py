@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Check that the vectorized return calculators agree with the scalar ones
+Compares calculate_daily_returns and calculate_referral_bonuses with
+calculate_daily_return and calculate_referral_bonus on random amounts and on
+the amounts at and around every plan boundary. Exits with code 1 if any
+amount differs by more than the tolerance
+
+Usage:
+    python check_return_calculators.py
+    python check_return_calculators.py --count 100000 --seed 7
+"""
+
+import argparse
+import random
+
+# Imported before app, which reads DATABASE_URL when it is imported
+from check_database import run_check
+
+import numpy as np
+
+from app import calculate_daily_return, calculate_daily_returns, calculate_referral_bonus, calculate_referral_bonuses
+
+TOLERANCE = 1e-9
+
+# Thresholds where the plans change, checked exactly and one float step either side
+PLAN_BOUNDARIES = [500, 1000, 2000]
+
+def boundary_amounts():
+    """Amounts at and around every plan boundary, plus the ones a form would submit"""
+    amounts = [0, 0.01, 499.99, 999.99, 1999.99, 2000.01, 1e6]
+    for boundary in PLAN_BOUNDARIES:
+        amounts += [np.nextafter(boundary, 0), boundary, np.nextafter(boundary, np.inf)]
+    return amounts
+
+def random_amounts(count, seed):
+    """Random amounts in rupees and paise across all plans"""
+    generator = random.Random(seed)
+    return [round(generator.uniform(0, 100000), 2) for _ in range(count)]
+
+def mismatches(name, scalar, vectorized, amounts):
+    """Amounts where the vectorized calculator differs from the scalar one"""
+    expected = np.array([scalar(float(amount)) for amount in amounts], dtype=float)
+    actual = vectorized(amounts)
+    return [f"{name}({amount!r}) = {got!r}, expected {want!r}"
+            for amount, got, want in zip(amounts, actual.tolist(), expected.tolist())
+            if abs(got - want) > TOLERANCE]
+
+def main():
+    """Compare both calculator pairs on the boundary and random amounts"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=10000, help='random amounts to check')
+    parser.add_argument('--seed', type=int, default=42, help='seed for the random amounts')
+    args = parser.parse_args()
+
+    failures = []
+    for label, amounts in [('boundary', boundary_amounts()), ('random', random_amounts(args.count, args.seed))]:
+        for name, scalar, vectorized in [
+            ('calculate_daily_returns', calculate_daily_return, calculate_daily_returns),
+            ('calculate_referral_bonuses', calculate_referral_bonus, calculate_referral_bonuses),
+        ]:
+            problems = mismatches(name, scalar, vectorized, amounts)
+            if problems:
+                print(f"❌ {name} on {len(amounts)} {label} amounts")
+                for problem in problems[:10]:
+                    print(f"    {problem}")
+                failures += problems
+            else:
+                print(f"✅ {name} on {len(amounts)} {label} amounts")
+
+    if failures:
+        print(f"❌ {len(failures)} amount(s) differ by more than {TOLERANCE}")
+        return 1
+    print("✅ Vectorized calculators match the scalar ones")
+    return 0
+
+if __name__ == '__main__':
+    run_check(main)
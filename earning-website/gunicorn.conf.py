@@ -0,0 +1,16 @@
+"""
+Gunicorn settings for the web process
+Run exactly like the Procfile's web entry: gunicorn --config gunicorn.conf.py app:app
+"""
+
+worker_class = 'gevent'
+worker_connections = 1000
+
+def post_fork(server, worker):
+    """Make psycopg2 wait for PostgreSQL cooperatively in each worker.
+
+    Without this a query blocks the worker's whole event loop, and with it
+    every other request and chat stream the worker is serving.
+    """
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
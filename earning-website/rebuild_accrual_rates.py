@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+Recompute every user's precomputed daily accrual rates from scratch
+Use this to verify the incrementally maintained rates or to repair them
+after editing investments or referrals directly in the database
+"""
+
+from app import app, rebuild_accrual_rates
+
+def main():
+    """Rebuild the daily_investment_rate and daily_referral_rate columns"""
+    with app.app_context():
+        print("Recomputing daily accrual rates...")
+        drifted = rebuild_accrual_rates()
+        
+        if drifted:
+            print(f"⚠️  {drifted} user(s) had drifted rates; they have been corrected")
+        else:
+            print("✅ All stored rates matched the recomputed values")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+"""
+Clock process for scheduled jobs (daily earnings)
+Run exactly like the Procfile's clock entry: python scheduler.py
+Several copies may run; they elect a single leader through the database
+"""
+
+import signal
+import threading
+from app import app, run_scheduler, SCHEDULER_HOLDER
+
+def main():
+    """Run the scheduler until interrupted"""
+    # This process serves no requests, so the earnings run may fork its process pool
+    app.config['EARNINGS_PROCESS_POOL'] = True
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+    
+    print(f"⏰ Scheduler process {SCHEDULER_HOLDER} waiting for leadership...")
+    run_scheduler(stop_event)
+    print("Scheduler stopped")
+
+if __name__ == '__main__':
+    main()
@@ -6,17 +6,9 @@ This script will help you set up the earning website with sample data
 
 import os
 import sys
-from app import app, db, User, Investment, DailyEarning, Referral
+from app import (app, db, User, Investment, DailyEarning, Referral, generate_referral_code, rebuild_accrual_rates,
+                 rebuild_user_summaries, recompute_platform_stats)
 from werkzeug.security import generate_password_hash
-import random
-import string
-
-def generate_referral_code():
-    """Generate a unique 7-digit referral code"""
-    while True:
-        code = ''.join(random.choices(string.digits, k=7))
-        if not User.query.filter_by(referral_code=code).first():
-            return code
 
 def setup_database():
     """Create database tables and add sample data"""
@@ -91,6 +83,11 @@ def setup_database():
             db.session.add(referral2)
             db.session.commit()
             
+            # Sample investments bypass the approval flow, so derive the daily rates, summaries and platform totals
+            rebuild_accrual_rates()
+            rebuild_user_summaries()
+            recompute_platform_stats()
+            
             print("Database setup completed!")
             print("\nSample Users Created:")
             print("Admin User: username='admin', password='admin123'")